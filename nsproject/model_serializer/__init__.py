@@ -0,0 +1 @@
+default_app_config = 'model_serializer.apps.ModelSerializerConfig'
@@ -1,5 +1,33 @@
-from django.apps import AppConfig
+import logging
+
+from django.apps import AppConfig, apps
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 
 class ModelSerializerConfig(AppConfig):
     name = 'model_serializer'
+
+    def ready(self):
+        # MODEL_SERIALIZER_EAGER_COMPILE 为 True 时，启动时编译所有定义了 Serializer 的 Model，
+        # 避免第一次请求时才编译，字段声明错误也会在启动时暴露
+        if getattr(settings, 'MODEL_SERIALIZER_EAGER_COMPILE', False):
+            from model_serializer.serializers.model import compile_model_serializers
+
+            timings = compile_model_serializers(apps.get_models())
+            for ModelClass, seconds in timings.items():
+                logger.info('compiled serializer %s in %.2fms', ModelClass._meta.label, seconds * 1000)
+
+        # 使用缓存总数（count="cached"）的 Model，启动时即注册失效信号，
+        # 否则只有获取过缓存总数的进程才会在保存、删除时使缓存失效
+        from model_serializer.response.count import watch_cached_count
+
+        for label in getattr(settings, 'MODEL_SERIALIZER_CACHED_COUNT_MODELS', ()):
+            watch_cached_count(apps.get_model(label))
+
+        # 声明了行缓存（Serializer、ListSerializer 等中的 CACHE）的 Model，注册使缓存失效的信号
+        from model_serializer.serializers.cache import watch_row_cache
+
+        for ModelClass in apps.get_models():
+            watch_row_cache(ModelClass)
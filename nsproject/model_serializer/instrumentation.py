@@ -0,0 +1,291 @@
+import re
+import time
+import logging
+import warnings
+import functools
+import threading
+import contextvars
+
+from collections import defaultdict
+from contextlib import contextmanager, ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import QuerySet
+from django.dispatch import Signal
+
+logger = logging.getLogger(__name__)
+
+# 统计结束时发送，参数：request、response、metrics
+request_instrumented = Signal()
+
+_current_metrics = contextvars.ContextVar('model_serializer_metrics', default=None)
+
+# 同一个字段重复执行相同 SQL 的默认告警次数
+DEFAULT_DUPLICATE_QUERY_THRESHOLD = 5
+
+_IN_PARAMS = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    一次响应中执行的查询次数超过了限制
+    """
+
+
+class DuplicateQueryWarning(UserWarning):
+    """
+    序列化同一个字段时重复执行了相同的 SQL，通常是缺少 select_related / prefetch_related 导致的 N+1 查询
+    """
+
+
+class Metrics:
+    """
+    一次请求中各阶段的耗时（秒）及查询次数
+
+    timings 的 key：
+    * db: 所有 SQL 的执行耗时
+    * pagination: 分页（count、当前页的查询）
+    * serialize: 序列化，包括序列化过程中延迟加载关联对象的查询
+    * encode: JSON 编码，使用 JSONEncoder 时包括嵌套关联对象的序列化
+
+    profile_fields 为 True 时，fields 中记录每个字段取值函数的调用次数及耗时，
+    key 为 {Model}.{field}，value 为 [calls, seconds]。
+
+    query_budget 为查询次数的上限，超过时抛出 QueryBudgetExceeded；
+    duplicate_threshold 不为 None 时，同一个字段执行相同 SQL 的次数达到该值将发出 DuplicateQueryWarning，
+    此时会自动统计字段耗时，以便确定查询是由哪个字段发起的。
+
+    通过 propagate_metrics() 在线程池中执行的查询（并发 COUNT、io_bound 字段、api.aok / api.apage）同样会被统计，
+    进程池中执行的 cpu_bound 字段不能访问数据库，不统计。
+    """
+
+    def __init__(self, profile_fields=False, query_budget=None, duplicate_threshold=None):
+        self.profile_fields = profile_fields or duplicate_threshold is not None
+        self.query_budget = query_budget
+        self.duplicate_threshold = duplicate_threshold
+        self.queries = 0
+        self.timings = defaultdict(float)
+        self.fields = defaultdict(lambda: [0, 0.0])
+        # 正在取值的字段，及每个字段执行的 SQL 次数，key 为 (field, sql)
+        self.current_field = None
+        self.query_shapes = defaultdict(int)
+        # 外层的 Metrics，在其他线程中执行的查询也要计入外层
+        self.outer = None
+        # 多个线程中的查询同时计数
+        self.lock = threading.Lock()
+
+    def duplicate_queries(self, limit=5):
+        """
+        返回重复次数最多的查询：[(field, sql, count), ...]，field 为 None 表示不在字段取值过程中
+        """
+        shapes = sorted(self.query_shapes.items(), key=lambda item: item[1], reverse=True)
+        return [(field, sql, count) for (field, sql), count in shapes[:limit] if count > 1]
+
+    def slowest_fields(self, limit=5):
+        """
+        返回耗时最多的字段：[(name, calls, seconds), ...]
+        """
+        fields = sorted(self.fields.items(), key=lambda item: item[1][1], reverse=True)
+        return [(name, calls, seconds) for name, (calls, seconds) in fields[:limit]]
+
+    def server_timing(self, fields_limit=5):
+        """
+        生成 Server-Timing 响应头的内容
+        """
+        entries = [f'db;dur={self.timings["db"] * 1000:.2f};desc="{self.queries} queries"']
+        for name in ('pagination', 'serialize', 'encode'):
+            if name in self.timings:
+                entries.append(f'{name};dur={self.timings[name] * 1000:.2f}')
+        for name, calls, seconds in self.slowest_fields(fields_limit):
+            entries.append(f'field.{name};dur={seconds * 1000:.2f};desc="{calls} calls"')
+        return ', '.join(entries)
+
+
+def get_current_metrics():
+    """
+    返回当前正在统计的 Metrics，未开启统计时返回 None
+    """
+    return _current_metrics.get()
+
+
+@contextmanager
+def instrument(profile_fields=False, query_budget=None, duplicate_threshold=None):
+    """
+    统计 with 语句中的查询次数及各阶段耗时，参数见 Metrics
+
+    usage:
+        with instrument() as metrics:
+            response = api.page(request, qs, group="list")
+        print(metrics.queries, metrics.timings)
+
+    嵌套使用时，内层的耗时统计结束后会累加到外层。
+    """
+    outer = _current_metrics.get()
+    metrics = Metrics(profile_fields, query_budget, duplicate_threshold)
+    metrics.outer = outer
+    token = _current_metrics.set(metrics)
+    try:
+        with ExitStack() as stack:
+            wrapper = functools.partial(_execute_wrapper, metrics)
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(wrapper))
+            yield metrics
+    finally:
+        _current_metrics.reset(token)
+        if outer is not None:
+            # 查询次数已经由外层的 execute_wrapper 统计
+            for name, seconds in metrics.timings.items():
+                if name != 'db':
+                    outer.timings[name] += seconds
+            for name, (calls, seconds) in metrics.fields.items():
+                outer.fields[name][0] += calls
+                outer.fields[name][1] += seconds
+
+
+def propagate_metrics(func):
+    """
+    在当前线程中调用，返回提交到线程池执行的函数：执行时使用当前线程的 contextvars，
+    并为执行线程的数据库连接加上当前（及外层）Metrics 的 execute_wrapper，查询计入当前的统计及查询次数限制。
+    未开启统计时原样返回 func。
+
+    每次提交任务都需要调用一次，同一个 contextvars.Context 不能同时在多个线程中使用。
+    """
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return func
+    return functools.partial(_run_with_metrics, contextvars.copy_context(), metrics, func)
+
+
+def _run_with_metrics(context, metrics, func, *args, **kwargs):
+    with ExitStack() as stack:
+        while metrics is not None:
+            wrapper = functools.partial(_execute_wrapper, metrics)
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(wrapper))
+            metrics = metrics.outer
+        return context.run(func, *args, **kwargs)
+
+
+def query_guard(query_budget=None, duplicate_threshold=DEFAULT_DUPLICATE_QUERY_THRESHOLD):
+    """
+    限制 with 语句中的查询次数，并检查 N+1 查询，参数见 Metrics
+    """
+    return instrument(query_budget=query_budget, duplicate_threshold=duplicate_threshold)
+
+
+@contextmanager
+def timer(name):
+    """
+    将 with 语句的耗时累加到当前 Metrics 的 timings[name] 中，未开启统计时不做任何处理
+    """
+    metrics = _current_metrics.get()
+    if metrics is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timings[name] += time.perf_counter() - start
+
+
+def is_profiling_fields():
+    """
+    当前是否正在统计字段耗时
+    """
+    metrics = _current_metrics.get()
+    return metrics is not None and metrics.profile_fields
+
+
+def instrument_getter(label, key, getter):
+    """
+    当前请求开启了字段耗时统计时，为字段的取值函数加上计时，否则原样返回
+    """
+    metrics = _current_metrics.get()
+    if metrics is None or not metrics.profile_fields:
+        return getter
+    name = f'{label}.{key}'
+    return functools.partial(_timed_getter, metrics, name, metrics.fields[name], getter)
+
+
+def _timed_getter(metrics, name, stat, getter, instance):
+    previous, metrics.current_field = metrics.current_field, name
+    start = time.perf_counter()
+    try:
+        value = getter(instance)
+        # 多对多、反向外键返回的是未执行的 QuerySet，在这里执行，查询才能计入该字段
+        if isinstance(value, QuerySet) and value._result_cache is None:
+            value._fetch_all()
+        return value
+    finally:
+        metrics.current_field = previous
+        stat[0] += 1
+        stat[1] += time.perf_counter() - start
+
+
+def _execute_wrapper(metrics, execute, sql, params, many, context):
+    with metrics.lock:
+        metrics.queries += 1
+        queries = metrics.queries
+    if metrics.query_budget is not None and queries > metrics.query_budget:
+        duplicates = '; '.join(f'{field}: {count} x {sql}' for field, sql, count in metrics.duplicate_queries())
+        raise QueryBudgetExceeded(
+            f'查询次数超过了限制 {metrics.query_budget}' + (f'，重复的查询：{duplicates}' if duplicates else '')
+        )
+
+    if metrics.duplicate_threshold is not None:
+        shape = (metrics.current_field, _IN_PARAMS.sub('IN (...)', sql))
+        with metrics.lock:
+            metrics.query_shapes[shape] += 1
+            count = metrics.query_shapes[shape]
+        if count == metrics.duplicate_threshold and metrics.current_field is not None:
+            model, field = metrics.current_field.split('.', 1)
+            warnings.warn(
+                f'序列化字段 {model}.{field} 时重复执行了 {metrics.duplicate_threshold} 次相同的查询，'
+                f'请使用 select_related / prefetch_related 或 {model}.serialize_many_{field}()：{shape[1]}',
+                DuplicateQueryWarning,
+            )
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        with metrics.lock:
+            metrics.timings['db'] += elapsed
+
+
+class InstrumentationMiddleware:
+    """
+    统计每个请求的查询次数、分页、序列化、编码耗时，请求结束时发送 request_instrumented 信号
+
+    * settings.MODEL_SERIALIZER_SERVER_TIMING（默认与 DEBUG 相同）为 True 时，结果输出到 Server-Timing 响应头
+    * settings.MODEL_SERIALIZER_PROFILE_FIELDS 为 True 时，统计每个字段的耗时，并输出耗时最多的字段
+    * settings.MODEL_SERIALIZER_QUERY_BUDGET 为每个请求的查询次数上限，超过时抛出 QueryBudgetExceeded
+    * settings.MODEL_SERIALIZER_DUPLICATE_QUERY_THRESHOLD 为 N+1 查询的告警次数，默认不检查
+
+    注意：流式响应（api.stream、api.export）的序列化发生在响应返回之后，不会被统计；
+    线程池中的查询（并发 COUNT、io_bound 字段、api.aok / api.apage）会被统计，见 propagate_metrics。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile_fields = getattr(settings, 'MODEL_SERIALIZER_PROFILE_FIELDS', False)
+        with instrument(
+                profile_fields=profile_fields,
+                query_budget=getattr(settings, 'MODEL_SERIALIZER_QUERY_BUDGET', None),
+                duplicate_threshold=getattr(settings, 'MODEL_SERIALIZER_DUPLICATE_QUERY_THRESHOLD', None),
+        ) as metrics:
+            response = self.get_response(request)
+
+        request_instrumented.send(sender=self.__class__, request=request, response=response, metrics=metrics)
+
+        if getattr(settings, 'MODEL_SERIALIZER_SERVER_TIMING', settings.DEBUG):
+            response['Server-Timing'] = metrics.server_timing()
+        if metrics.profile_fields and metrics.fields:
+            logger.debug('slowest fields of %s: %s', request.path, metrics.slowest_fields())
+        return response
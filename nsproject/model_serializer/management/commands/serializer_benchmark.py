@@ -0,0 +1,190 @@
+import json
+import time
+import platform
+import statistics
+import tracemalloc
+
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from model_serializer.models import Tasks, TasksTopo, Reports
+from model_serializer.response import api
+from model_serializer.serializers import serialize_model, json_dumps
+
+# --sqlite 使用的内存数据库别名
+SQLITE_ALIAS = "serializer_benchmark_sqlite"
+
+
+class Command(BaseCommand):
+    help = (
+        "在事务中写入测试数据，测量序列化、JSON 编码、分页接口的耗时、查询次数及内存峰值，"
+        "结果以 JSON 输出，结束后回滚写入的数据"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tasks", type=int, default=1000, help="写入的 Tasks 数量（每个 Tasks 一个 TasksTopo）")
+        parser.add_argument("--reports-per-task", type=int, default=2, help="每个 Tasks 的 Reports 数量")
+        parser.add_argument("--page-size", type=int, default=100, help="api.page 每页的数量")
+        parser.add_argument("--repeat", type=int, default=20, help="每项测量的重复次数")
+        parser.add_argument("--database", default="default", help="使用的数据库")
+        parser.add_argument("--migrate", action="store_true", help="测量前先执行 migrate，用于内存数据库")
+        parser.add_argument("--sqlite", action="store_true",
+                            help="使用 SQLite 内存数据库（自动 migrate），不需要在 settings 中配置，忽略 --database")
+        parser.add_argument("--output", help="结果写入的文件，默认输出到 stdout")
+
+    def handle(self, *args, **options):
+        using = options["database"]
+        if options["sqlite"]:
+            using = add_sqlite_database()
+            options["migrate"] = True
+        if options["migrate"]:
+            call_command("migrate", database=using, verbosity=0)
+
+        with transaction.atomic(using=using):
+            seed(options["tasks"], options["reports_per_task"], using=using)
+            results = run_benchmarks(
+                page_size=options["page_size"], repeat=options["repeat"], using=using,
+            )
+            transaction.set_rollback(True, using=using)
+
+        results["meta"] = dict(
+            python=platform.python_version(),
+            django=django.get_version(),
+            database=connections[using].vendor,
+            tasks=options["tasks"],
+            reports_per_task=options["reports_per_task"],
+            page_size=options["page_size"],
+            repeat=options["repeat"],
+        )
+
+        content = json.dumps(results, indent=2, ensure_ascii=False)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(content)
+        else:
+            self.stdout.write(content)
+
+
+def add_sqlite_database():
+    """
+    添加一个 SQLite 内存数据库，返回其别名
+
+    connections.databases 与 settings.DATABASES 是同一个 dict，添加后 migrate 等命令也可以使用该别名。
+    """
+    connections.databases.setdefault(SQLITE_ALIAS, {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"})
+    return SQLITE_ALIAS
+
+
+def seed(tasks, reports_per_task, *, using="default"):
+    """
+    批量写入测试数据
+    """
+    topos = TasksTopo.objects.using(using).bulk_create([
+        TasksTopo(bk_biz_id=i, bk_obj_id="set", bk_inst_id=i, bk_inst_name=f"node-{i}", path=f"/biz/{i}")
+        for i in range(tasks)
+    ], batch_size=500)
+    if topos and topos[0].pk is None:
+        # 不支持 bulk_create 返回主键的数据库，重新查询
+        topos = list(TasksTopo.objects.using(using).order_by("-pk")[:tasks])[::-1]
+
+    task_objects = Tasks.objects.using(using).bulk_create([
+        Tasks(task_topo=topo, task_name=i, test_list=[i, {"index": i}], test_char="x" * (i % 64))
+        for i, topo in enumerate(topos)
+    ], batch_size=500)
+    if task_objects and task_objects[0].pk is None:
+        task_objects = list(Tasks.objects.using(using).order_by("-pk")[:tasks])[::-1]
+
+    Reports.objects.using(using).bulk_create([
+        Reports(task_id=task, task_name=f"report-{task.task_name}", task_type="daily", name=f"report-{j}")
+        for task in task_objects for j in range(reports_per_task)
+    ], batch_size=500)
+
+
+def run_benchmarks(*, page_size, repeat, using="default"):
+    rf = RequestFactory()
+    connection = connections[using]
+    results = dict()
+
+    # serialize_model 单行耗时（数据已加载，不包含查询）
+    instances = list(Tasks.objects.using(using).select_related("task_topo").prefetch_related("report"))
+    timings = _measure(lambda: [serialize_model(obj, group="list") for obj in instances], repeat)
+    results["serialize_model"] = dict(
+        rows=len(instances),
+        per_row_us=_summary([t / max(len(instances), 1) * 1e6 for t in timings]),
+    )
+
+    # JSONEncoder 编码吞吐量
+    timings = _measure(lambda: json_dumps(instances), repeat)
+    size = len(json_dumps(instances))
+    results["json_encoder"] = dict(
+        rows=len(instances),
+        bytes=size,
+        rows_per_second=len(instances) / statistics.median(timings) if timings else 0,
+        mb_per_second=size / 1024 / 1024 / statistics.median(timings) if timings else 0,
+    )
+
+    # api.page 端到端耗时及查询次数，每个 Model 的默认字段及每个 field_groups 各测量一次
+    pages = []
+    for ModelClass in (Tasks, TasksTopo, Reports):
+        for group in (None, *ModelClass.Serializer.field_groups):
+            def request():
+                return api.page(rf.get("/", {"page_size": page_size}),
+                                ModelClass.objects.using(using).order_by("pk"), group=group,
+                                max_page_size=page_size, max_records=-1)
+
+            with CaptureQueriesContext(connection) as queries:
+                response = request()
+            timings = _measure(request, repeat)
+            pages.append(dict(
+                model=ModelClass._meta.label,
+                group=group,
+                queries=len(queries),
+                bytes=len(response.content),
+                latency_ms=_summary([t * 1000 for t in timings]),
+            ))
+    results["api_page"] = pages
+
+    # 内存峰值
+    results["peak_memory_kb"] = dict(
+        api_page=_peak_memory(
+            lambda: api.page(rf.get("/", {"page_size": page_size}),
+                             Tasks.objects.using(using).order_by("pk"), group="list",
+                             max_page_size=page_size, max_records=-1)
+        ),
+        serialize_all=_peak_memory(lambda: json_dumps(Tasks.objects.using(using).all())),
+    )
+    return results
+
+
+def _measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _summary(values):
+    if not values:
+        return {}
+    values = sorted(values)
+    return dict(
+        min=values[0],
+        p50=statistics.median(values),
+        p95=values[min(len(values) - 1, int(len(values) * 0.95))],
+        mean=statistics.mean(values),
+    )
+
+
+def _peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
@@ -35,6 +35,10 @@ class Tasks(models.Model):
         field_groups = {
             "list": ["task_topo", "task_name", "test_list", "test_char", "app", "report"]
         }
+        # serialize_{field}() 需要读取的字段，用于自动 only()；未声明时不限制查询的字段
+        field_dependencies = {
+            "app": [],
+        }
 
 
 class Reports(models.Model):
@@ -1,10 +1,103 @@
-from django.http import JsonResponse
+import operator
+import functools
 
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db.models import QuerySet, Model
+from django.core.paginator import Page as PaginatorPage
+from django.utils.cache import patch_vary_headers
+
+from model_serializer.instrumentation import timer
+from model_serializer.instrumentation import query_guard
+from model_serializer.instrumentation import propagate_metrics
 from model_serializer.response.base import ResponseException
 from model_serializer.response.base import Code
 from model_serializer.response.pagination import get_pagination
+from model_serializer.response.pagination import get_cursor_pagination
+from model_serializer.response.conditional import ConditionalResponse
+from model_serializer.response.coalesce import single_flight
+from model_serializer.response.coalesce import get_query_key
+from model_serializer.response.export import ExportResponse
+from model_serializer.response.export import EXPORT_NDJSON
+from model_serializer.response.export import accepts_gzip
+from model_serializer.response.export import get_export_header
 from model_serializer.serializers import JSONEncoder
 from model_serializer.serializers import LazySerializeProfile
+from model_serializer.serializers import serialize_objects
+from model_serializer.serializers import optimize_queryset
+from model_serializer.serializers import iter_serialized_chunks
+from model_serializer.serializers import NativeSerializer
+from model_serializer.serializers import json_backend_dumps
+from model_serializer.serializers.raw_json import RawJSONCollector
+
+# 列表数据的紧凑格式：
+# * rows: {"fields": [...], "rows": [[...], ...]}
+# * columns: {"fields": [...], "columns": [[...], ...]}，每个字段一个数组
+FORMAT_ROWS = "rows"
+FORMAT_COLUMNS = "columns"
+
+
+def _with_query_budget(func):
+    """
+    为 API 函数加上 query_budget 参数：限制构造响应时的查询次数，超过时抛出 QueryBudgetExceeded，
+    同一个字段重复执行相同的查询时发出 DuplicateQueryWarning（N+1 查询）
+    """
+    @functools.wraps(func)
+    def wrapper(*args, query_budget=None, **kwargs):
+        if query_budget is None:
+            return func(*args, **kwargs)
+        with query_guard(query_budget):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _with_coalescing(make_key):
+    """
+    为 API 函数加上 coalesce 参数：同一进程中同时进行的相同请求只构造一次响应，共享编码好的响应内容。
+    coalesce 为 True 时只合并同时进行的请求，为数字时响应内容在完成后继续保留该秒数。
+
+    make_key 返回请求的 key（查询的 SQL、序列化方案、分页参数等），返回 None 时不合并。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, coalesce=False, **kwargs):
+            key = make_key(*args, **kwargs) if coalesce else None
+            if key is None:
+                return func(*args, **kwargs)
+            ttl = None if coalesce is True else coalesce
+            return single_flight.do((func.__name__, key), lambda: func(*args, **kwargs), ttl=ttl)
+
+        return wrapper
+
+    return decorator
+
+
+def _ok_coalesce_key(data=None, *, profile=None, conditional_request=None, **params):
+    # 只合并 QuerySet；profile 对象无法计算 key，条件响应依赖请求头，都不合并
+    if profile is not None or conditional_request is not None:
+        return None
+    query_key = get_query_key(data)
+    if query_key is None:
+        return None
+    return query_key, _conditional_key(**params)
+
+
+def _page_coalesce_key(request, queryset, *, profile=None, **params):
+    if profile is not None:
+        return None
+    query_key = get_query_key(queryset)
+    if query_key is None:
+        return None
+    # querystring 中包含页码、页大小、游标、format 等分页参数
+    return (
+        query_key, request.get_full_path(),
+        request.META.get('HTTP_IF_NONE_MATCH'), request.META.get('HTTP_IF_MODIFIED_SINCE'),
+        _conditional_key(**params),
+    )
 
 
 class ApiResponse(JsonResponse, ResponseException):
@@ -17,23 +110,80 @@ class ApiResponse(JsonResponse, ResponseException):
                  data=None,
                  serialize_profile=None,
                  pagination=None,
+                 native=False,
+                 raw_json=None,
                  ):
         content = dict(code=code, message=message, data=data)
         if pagination is not None:
             content["pagination"] = pagination
 
-        JsonResponse.__init__(self,
-                              status=status, data=content,
-                              encoder=JSONEncoder, safe=False,
-                              json_dumps_params=dict(serialize_profile=serialize_profile),
-                              )
+        with timer('encode'):
+            if native:
+                # data 已经全部是 JSON 原生类型，直接使用 JSON 后端编码，不需要 JSONEncoder；
+                # RawJSON 的占位字符串在编码后替换为原始文本
+                content = json_backend_dumps(content)
+                if raw_json is not None:
+                    content = raw_json.splice(content)
+                HttpResponse.__init__(self,
+                                      status=status, content=content,
+                                      content_type='application/json',
+                                      )
+            else:
+                JsonResponse.__init__(self,
+                                      status=status, data=content,
+                                      encoder=JSONEncoder, safe=False,
+                                      json_dumps_params=dict(serialize_profile=serialize_profile),
+                                      )
         ResponseException.__init__(self, f'<ApiResponse status={status} code={code} message="{message}">')
 
 
+class StreamingApiResponse(StreamingHttpResponse, ResponseException):
+    """
+    流式的 API 响应，响应结构与 ApiResponse 相同，但 data 中的数据会分块读取、序列化并输出。
+
+    QuerySet 与导出使用相同的 keyset 分块读取，内存占用只与 chunk_size 有关；
+    无法使用 keyset 分块的 QuerySet 退化为 .iterator()，具体见 iter_queryset_chunks。
+
+    data 必须是 QuerySet 或任意可迭代对象。
+    """
+
+    def __init__(self,
+                 *,
+                 status: int = 200,
+                 code: Code = Code.OK,
+                 message: str = "",
+                 data=None,
+                 serialize_profile=None,
+                 chunk_size: int = 2000,
+                 ):
+        encoder = JSONEncoder(serialize_profile=serialize_profile)
+        StreamingHttpResponse.__init__(self,
+                                       streaming_content=self._stream_content(encoder, code, message, data,
+                                                                              serialize_profile, chunk_size),
+                                       status=status, content_type='application/json',
+                                       )
+        ResponseException.__init__(self, f'<StreamingApiResponse status={status} code={code} message="{message}">')
+
+    @staticmethod
+    def _stream_content(encoder, code, message, data, serialize_profile, chunk_size):
+        yield f'{{"code": {encoder.encode(code)}, "message": {encoder.encode(message)}, "data": ['.encode()
+
+        separator = ''
+        for rows in iter_serialized_chunks(() if data is None else data, serialize_profile, chunk_size):
+            content = ', '.join(encoder.encode(row) for row in rows)
+            yield f'{separator}{content}'.encode()
+            separator = ', '
+
+        yield b']}'
+
+
+@_with_coalescing(_ok_coalesce_key)
+@_with_query_budget
 def ok(data=None,
        *,
        message='ok', code=None, pagination=None,
-       profile=None, fields=None, group=None,
+       profile=None, fields=None, group=None, serializer=None,
+       conditional_request=None, cache_timeout=None, native=None, format=None,
        **kwargs
        ):
     """
@@ -46,6 +196,19 @@ def ok(data=None,
     :param profile: 序列化方案配置。
     :param fields: 需要序列化的字段。
     :param group: 需要序列化的字段组。
+    :param serializer: 使用 Model 上的哪个 serializer 类，如 "ListSerializer"，默认为 Serializer。
+    :param conditional_request: 若提供 HttpRequest，将根据 data（QuerySet 或 model 实例）的 updated_at
+      计算 ETag / Last-Modified，请求中的 If-None-Match / If-Modified-Since 匹配时直接返回 304。
+    :param cache_timeout: 条件响应时，响应内容按照 ETag 缓存的时间（秒），默认不缓存。
+    :param native: 是否先将 data 转换为 JSON 原生类型，再使用 settings.MODEL_SERIALIZER_JSON_BACKEND 编码，
+      默认使用 settings.MODEL_SERIALIZER_NATIVE 的值（False）。
+    :param format: 列表数据的紧凑格式，"rows" 或 "columns"，字段名只输出一次，默认为 dict 列表，
+      具体见 FORMAT_ROWS / FORMAT_COLUMNS。
+    :param query_budget: 构造响应时允许执行的查询次数，超过时抛出 QueryBudgetExceeded，
+      同时检查序列化字段导致的 N+1 查询，默认不限制。
+    :param coalesce: 是否合并同一进程中同时进行的相同请求（data 为 QuerySet，相同的 SQL、序列化参数），
+      只构造一次响应，其他请求等待并共享编码好的响应内容。为数字时，响应内容在完成后继续保留该秒数，
+      用于吸收突发的请求。序列化结果依赖 SQL 和参数以外的数据（如当前用户）时不要使用。
     :param **kwargs: 序列化时需要额外使用的参数。
 
     data 必须是这几种类型：
@@ -57,16 +220,135 @@ def ok(data=None,
     if code is None:
         code = Code.OK
 
-    if fields or group:
-        profile = LazySerializeProfile(fields=fields, group=group, **kwargs)
+    conditional = None
+    if conditional_request is not None:
+        conditional = ConditionalResponse(
+            conditional_request, data, cache_timeout=cache_timeout,
+            key=_conditional_key(message=message, code=code, fields=fields, group=group, serializer=serializer,
+                                 format=format, **kwargs),
+        )
+        response = conditional.get_response()
+        if response is not None:
+            return response
+
+    if fields or group or serializer:
+        profile = LazySerializeProfile(fields=fields, group=group, serializer=serializer, **kwargs)
+
+    keys = None
+    if format is not None:
+        if format not in (FORMAT_ROWS, FORMAT_COLUMNS):
+            raise ValueError(f"不支持的 format：{format}")
+        keys = get_export_header(data.paginator.object_list if isinstance(data, PaginatorPage) else data, profile)
 
-    return ApiResponse(
+    if isinstance(data, QuerySet):
+        data = _optimize_queryset(data, profile=profile, fields=fields, group=group, serializer=serializer)
+
+    if native is None:
+        native = getattr(settings, 'MODEL_SERIALIZER_NATIVE', False)
+
+    raw_json = None
+    with timer('serialize'):
+        if native:
+            raw_json = RawJSONCollector()
+            data = NativeSerializer(profile, raw_json).convert(data)
+        elif isinstance(data, (list, tuple, QuerySet, PaginatorPage)):
+            # 列表数据一次性解析 serializer 和序列化方案，避免 JSONEncoder 逐个实例回调
+            data = serialize_objects(data, profile)
+
+        if format is not None:
+            data = _to_compact_format(data, format, keys)
+
+    response = ApiResponse(
         status=200, code=code, message=message, data=data, pagination=pagination,
-        serialize_profile=profile,
+        serialize_profile=profile, native=native, raw_json=raw_json,
     )
+    if conditional is not None:
+        response = conditional.finalize(response)
+    return response
 
 
-def page(request, queryset, *, page=None, page_size=None, max_page_size=None, max_records=None, **kwargs):
+def stream(data,
+           *,
+           message='ok', code=None, chunk_size=None,
+           profile=None, fields=None, group=None, serializer=None,
+           **kwargs
+           ):
+    """
+    构造一个流式响应，用于不分页、数据量很大的场景，如管理后台、导出
+
+    QuerySet 按照其排序（未排序时按主键）以 keyset 分块读取，排序字段不能为 NULL。
+
+    :param data: QuerySet 或任意可迭代对象（iterator）。
+    :param message: API 响应中 message 的内容。
+    :param code: API 响应中 code 的值，默认为 Code.OK。
+    :param chunk_size: 每次从数据库读取并序列化的数量，默认为 2000。
+    :param profile: 序列化方案配置。
+    :param fields: 需要序列化的字段。
+    :param group: 需要序列化的字段组。
+    :param serializer: 使用 Model 上的哪个 serializer 类，如 "ListSerializer"，默认为 Serializer。
+    :param **kwargs: 序列化时需要额外使用的参数。
+    """
+    if code is None:
+        code = Code.OK
+
+    if fields or group or serializer:
+        profile = LazySerializeProfile(fields=fields, group=group, serializer=serializer, **kwargs)
+
+    if isinstance(data, QuerySet):
+        data = _optimize_queryset(data, profile=profile, fields=fields, group=group, serializer=serializer)
+
+    return StreamingApiResponse(
+        status=200, code=code, message=message, data=data,
+        serialize_profile=profile, chunk_size=chunk_size or 2000,
+    )
+
+
+def export(request, queryset,
+           *,
+           format=EXPORT_NDJSON, chunk_size=None, compress=None, filename=None,
+           profile=None, fields=None, group=None, serializer=None,
+           **kwargs
+           ):
+    """
+    构造一个导出响应，每条数据一行，用于导出大量数据，代替 max_records=-1 的分页接口
+
+    :param request: Django HttpRequest 对象。
+    :param queryset: QuerySet 或任意可迭代对象（iterator）。
+    :param format: 导出格式，"ndjson"（默认）或 "csv"，csv 的表头为序列化方案输出的字段名。
+    :param chunk_size: 每次从数据库读取并序列化的数量，默认为 2000。
+    :param compress: 是否使用 gzip 压缩输出，默认根据请求的 Accept-Encoding 判断。
+    :param filename: 若指定，将作为附件下载时的文件名。
+    :param profile: 序列化方案配置。
+    :param fields: 需要序列化的字段。
+    :param group: 需要序列化的字段组。
+    :param serializer: 使用 Model 上的哪个 serializer 类，如 "ListSerializer"，默认为 Serializer。
+    :param **kwargs: 序列化时需要额外使用的参数。
+    """
+    if fields or group or serializer:
+        profile = LazySerializeProfile(fields=fields, group=group, serializer=serializer, **kwargs)
+
+    header = get_export_header(queryset, profile)
+    if isinstance(queryset, QuerySet):
+        queryset = _optimize_queryset(queryset, profile=profile, fields=fields, group=group, serializer=serializer)
+
+    auto_compress = compress is None
+    if auto_compress:
+        compress = accepts_gzip(request)
+
+    response = ExportResponse(
+        data=queryset, format=format, serialize_profile=profile, header=header,
+        chunk_size=chunk_size or 2000, compress=compress, filename=filename,
+    )
+    if auto_compress:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+@_with_coalescing(_page_coalesce_key)
+@_with_query_budget
+def page(request, queryset, *, page=None, page_size=None, max_page_size=None, max_records=None,
+         mode=None, ordering=None, cursor=None, count=None, count_timeout=None, concurrent_count=None,
+         conditional=False, cache_timeout=None, format=None, **kwargs):
     """
     构造一个分页响应
 
@@ -79,15 +361,151 @@ def page(request, queryset, *, page=None, page_size=None, max_page_size=None, ma
       一般用于某些需要强制指定页码大小的场景。
     :param max_records: 最多返回多少记录数，默认为 1000，主要用于防止爬虫。
       若不需要限制（如管理后台接口），请赋值为 -1。
+    :param count: 总数的计算方式："exact"（默认）、"cached"、"approximate"，具体见 get_pagination。
+    :param count_timeout: count="cached" 时缓存的过期时间（秒）。
+    :param concurrent_count: 是否在另一个线程（另一个数据库连接）中与当前页的查询同时执行 COUNT，
+      默认使用 settings.MODEL_SERIALIZER_CONCURRENT_COUNT 的值（False）。
+    :param mode: 分页方式，默认按页码分页；为 "cursor" 时使用游标分页，
+      pagination 中返回 next/prev 游标，翻页时通过 querystring 中的 cursor 传回。
+    :param ordering: 游标分页的排序字段，如 ("-created_at", "id")，mode="cursor" 时必须提供。
+    :param cursor: 游标分页时，如果指定了，则使用该游标，否则从 request 中获取。
+    :param conditional: 是否支持条件响应，在分页、序列化之前根据 queryset 的 MAX(updated_at)、总数
+      计算 ETag / Last-Modified，请求中的 If-None-Match / If-Modified-Since 匹配时直接返回 304。
+    :param cache_timeout: 条件响应时，响应内容按照 ETag 缓存的时间（秒），默认不缓存。
+    :param format: 列表数据的紧凑格式，"rows" 或 "columns"，具体见 ok()。未指定时，
+      从 querystring 中 settings.MODEL_SERIALIZER_FORMAT_PARAM（默认为 format）参数获取，客户端可以自行选择。
+    :param query_budget: 构造响应时允许执行的查询次数（包括 count），具体见 ok()。
+    :param coalesce: 是否合并同时进行的相同请求（相同的 SQL、querystring、序列化参数），具体见 ok()。
     :param **serialize_options: model 序列化时，传递给 serialize() 函数的参数。
     """
-    paginator_page, _, pagination = get_pagination(
-        request,
-        queryset,
-        page=page,
-        page_size=page_size,
-        max_page_size=max_page_size,
-        max_records=max_records,
-    )
+    requested_format = False
+    if format is None:
+        format_param = getattr(settings, 'MODEL_SERIALIZER_FORMAT_PARAM', 'format')
+        if format_param and request.GET.get(format_param) in (FORMAT_ROWS, FORMAT_COLUMNS):
+            format = request.GET[format_param]
+            requested_format = True
+
+    conditional_response = None
+    if conditional:
+        conditional_response = ConditionalResponse(
+            request, queryset, cache_timeout=cache_timeout,
+            key=_conditional_key(page=page, page_size=page_size, max_page_size=max_page_size,
+                                 max_records=max_records, mode=mode, ordering=ordering, cursor=cursor,
+                                 format=format, **kwargs),
+        )
+        response = conditional_response.get_response()
+        if response is not None:
+            return response
+
+    with timer('pagination'):
+        if mode == "cursor":
+            # 游标分页需要从实例上读取游标的值，因此不使用 values_list() 序列化
+            queryset = _optimize_queryset(queryset, values=False, **kwargs)
+            data, pagination = get_cursor_pagination(
+                request,
+                queryset,
+                ordering=ordering,
+                cursor=cursor,
+                page_size=page_size,
+                max_page_size=max_page_size,
+            )
+        else:
+            if concurrent_count is None:
+                concurrent_count = getattr(settings, 'MODEL_SERIALIZER_CONCURRENT_COUNT', False)
+            # 在分页之前根据序列化方案加上 select_related / prefetch_related
+            queryset = _optimize_queryset(queryset, **kwargs)
+            data, _, pagination = get_pagination(
+                request,
+                queryset,
+                page=page,
+                page_size=page_size,
+                max_page_size=max_page_size,
+                max_records=max_records,
+                count=count,
+                count_timeout=count_timeout,
+                concurrent_count=concurrent_count,
+            )
+
+    # 客户端要求的紧凑格式只在数据为同一种 Model 或 dict 的列表时使用，其他数据忽略该参数
+    if requested_format and not _is_compactable(data):
+        format = None
+
+    response = ok(data=data, pagination=pagination, format=format, **kwargs)
+    if conditional_response is not None:
+        response = conditional_response.finalize(response)
+    return response
+
+
+async def aok(data=None, **kwargs):
+    """
+    ok() 的异步版本，用于 ASGI 下的 async view，参数与 ok() 相同
+
+    查询、序列化、编码整体在线程池中执行，每个请求只切换一次线程，不会阻塞事件循环。
+    """
+    return await _run_in_thread(ok, data, **kwargs)
+
+
+async def apage(request, queryset, **kwargs):
+    """
+    page() 的异步版本，用于 ASGI 下的 async view，参数与 page() 相同
+
+    Django 3.1 没有异步 ORM，count、分页查询、序列化、编码整体在线程池中执行，
+    每个请求只切换一次线程，而不是每次访问数据库都切换。
+    """
+    return await _run_in_thread(page, request, queryset, **kwargs)
+
+
+def _run_in_thread(func, *args, **kwargs):
+    # 不使用 thread_sensitive，多个请求可以在线程池中并发执行；
+    # 与同步请求的 request_started / request_finished 相同，执行前后都按照 CONN_MAX_AGE 关闭过期的连接，
+    # 避免线程复用已超过 CONN_MAX_AGE 或已被数据库断开的连接
+    def run():
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    # 线程中的查询计入 InstrumentationMiddleware 等外层的统计
+    return sync_to_async(propagate_metrics(run), thread_sensitive=False)()
+
+
+def _to_compact_format(rows, format, keys=None):
+    """
+    将序列化后的 dict 列表转换为紧凑格式，keys 为序列化方案输出的字段名，未提供时使用第一条数据的字段名
+    """
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise ValueError("format 只支持同一种 Model 的列表数据")
+
+    if keys is None:
+        keys = list(rows[0]) if rows else []
+
+    if format == FORMAT_COLUMNS:
+        return dict(fields=keys, columns=[[row[key] for row in rows] for key in keys])
+
+    if len(keys) == 1:
+        key = keys[0]
+        values = [[row[key]] for row in rows]
+    else:
+        getter = operator.itemgetter(*keys)
+        values = [list(getter(row)) for row in rows] if keys else [[] for _ in rows]
+    return dict(fields=keys, rows=values)
+
+
+def _is_compactable(data):
+    rows = list(data)
+    if all(isinstance(row, dict) for row in rows):
+        return True
+    return all(isinstance(row, Model) for row in rows) and len({row.__class__ for row in rows}) == 1
+
+
+def _conditional_key(**params):
+    # profile 对象没有稳定的 repr，不参与计算
+    return repr(sorted((key, value) for key, value in params.items() if key != 'profile'))
+
 
-    return ok(data=paginator_page, pagination=pagination, **kwargs)
\ No newline at end of file
+def _optimize_queryset(queryset, *, profile=None, fields=None, group=None, serializer=None, values=True, **kwargs):
+    if not (fields or group or serializer) and profile is not None and isinstance(queryset, QuerySet):
+        options = profile[queryset.model]
+        fields, group, serializer = options.get('fields'), options.get('group'), options.get('serializer')
+    return optimize_queryset(queryset, fields=fields, group=group, serializer=serializer, values=values)
@@ -0,0 +1,113 @@
+import time
+import threading
+
+from django.core.exceptions import EmptyResultSet
+from django.db.models import QuerySet
+from django.http import HttpResponse
+
+from model_serializer.response.base import ResponseException
+
+# 已完成的结果超过该数量时，清理已过期的结果
+_PURGE_THRESHOLD = 1024
+
+
+class CoalescedResponse(HttpResponse, ResponseException):
+    """
+    使用同一时间相同请求的响应内容构造的 API 响应
+    """
+
+    def __init__(self, status, content, headers):
+        HttpResponse.__init__(self, content=content, status=status)
+        for header, value in headers:
+            self[header] = value
+        ResponseException.__init__(self, f'<CoalescedResponse status={status}>')
+
+
+class _Call:
+    __slots__ = ('event', 'snapshot', 'error', 'expires_at')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.snapshot = None
+        self.error = None
+        self.expires_at = None
+
+
+class SingleFlight:
+    """
+    合并同一进程中同时进行的相同请求：第一个请求负责构造响应，其他请求等待并共享编码好的响应内容
+
+    提供 ttl 时，响应内容在完成后继续保留 ttl 秒，期间相同的请求直接使用该内容。
+    线程、asyncio（api.aok / api.apage 在线程池中执行）均适用。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = dict()
+
+    def do(self, key, func, *, ttl=None):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.expires_at is not None and call.expires_at <= time.monotonic():
+                del self._calls[key]
+                call = None
+
+            leader = call is None
+            if leader:
+                if len(self._calls) >= _PURGE_THRESHOLD:
+                    self._purge()
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            if call.snapshot is None:
+                # 流式响应等无法共享的响应，各自构造
+                return func()
+            return CoalescedResponse(*call.snapshot)
+
+        try:
+            response = func()
+            if not response.streaming:
+                call.snapshot = (response.status_code, response.content, list(response.items()))
+            return response
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if ttl and call.error is None and call.snapshot is not None:
+                    call.expires_at = time.monotonic() + ttl
+                elif self._calls.get(key) is call:
+                    del self._calls[key]
+            call.event.set()
+
+    def clear(self):
+        """
+        清空按 ttl 保留的响应内容
+        """
+        with self._lock:
+            self._calls = {key: call for key, call in self._calls.items() if call.expires_at is None}
+
+    def _purge(self):
+        now = time.monotonic()
+        for key in [key for key, call in self._calls.items()
+                    if call.expires_at is not None and call.expires_at <= now]:
+            del self._calls[key]
+
+
+single_flight = SingleFlight()
+
+
+def get_query_key(queryset):
+    """
+    返回 queryset 对应的 (数据库, SQL, 参数)，无法确定时返回 None
+    """
+    if not isinstance(queryset, QuerySet):
+        return None
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return None
+    return queryset.db, sql, repr(params)
@@ -0,0 +1,133 @@
+import hashlib
+
+from django.core.cache import caches
+from django.core.exceptions import FieldDoesNotExist
+from django.http import HttpResponse
+from django.db.models import QuerySet, Model, Max, Count
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from model_serializer.response.base import ResponseException
+from model_serializer.response.coalesce import get_query_key
+
+# 用于计算 Last-Modified 的字段
+DEFAULT_VERSION_FIELD = "updated_at"
+
+
+class CachedApiResponse(HttpResponse, ResponseException):
+    """
+    直接使用已缓存的响应内容构造的 API 响应
+    """
+
+    def __init__(self, content):
+        HttpResponse.__init__(self, content=content, content_type="application/json")
+        ResponseException.__init__(self, "<CachedApiResponse status=200>")
+
+
+def get_validators(data, version_field=DEFAULT_VERSION_FIELD):
+    """
+    在序列化之前计算 data 的校验值，返回 (last_modified, fingerprint)，无法计算时返回 None
+
+    * QuerySet: 一次查询得到 MAX(updated_at) 及 COUNT(*)，与查询的 SQL 及参数一起用于 ETag；
+      删除数据不会改变 MAX(updated_at)，因此 last_modified 为 None，不使用 If-Modified-Since
+    * model 实例: 实例的 updated_at 及 pk
+
+    注意：关联对象的变化不会反映在校验值中。
+    """
+    if isinstance(data, QuerySet):
+        if data.query.is_sliced:
+            return None
+        try:
+            data.model._meta.get_field(version_field)
+        except FieldDoesNotExist:
+            return None
+
+        result = data.aggregate(last_modified=Max(version_field), total=Count("pk"))
+        last_modified = None
+        # 不同的过滤条件可能有相同的 MAX(updated_at) 及 COUNT(*)，SQL 及参数用于区分
+        fingerprint = (get_query_key(data), result["last_modified"], result["total"])
+
+    elif isinstance(data, Model):
+        last_modified = getattr(data, version_field, None)
+        if last_modified is None:
+            return None
+        fingerprint = (data._meta.label_lower, data.pk, last_modified)
+
+    else:
+        return None
+
+    return last_modified, fingerprint
+
+
+class ConditionalResponse:
+    """
+    支持 ETag / Last-Modified 的条件响应
+
+    在序列化之前计算校验值，若请求中的 If-None-Match / If-Modified-Since 匹配，直接返回 304。
+    若提供了 cache_timeout，响应内容会按照 ETag 缓存，命中时不再查询、序列化、编码。
+
+    usage:
+        conditional = ConditionalResponse(request, queryset, key=(fields, group))
+        response = conditional.get_response()
+        if response is None:
+            response = conditional.finalize(build_response())
+    """
+
+    def __init__(self, request, data, *, key=None, cache_timeout=None, cache_alias="default"):
+        """
+        :param request: HttpRequest 对象。
+        :param data: QuerySet 或 model 实例，用于计算校验值，无法计算时不做任何处理。
+        :param key: 其他影响响应内容的参数，如序列化方案。
+        :param cache_timeout: 响应内容的缓存时间（秒），None 为不缓存。
+        :param cache_alias: 缓存响应内容使用的 Django cache。
+        """
+        self.request = request
+        self.cache_timeout = cache_timeout
+        self.cache = caches[cache_alias]
+        self.etag = self.last_modified = None
+
+        validators = get_validators(data)
+        if validators is not None:
+            last_modified, fingerprint = validators
+            content = repr((fingerprint, key, request.get_full_path()))
+            self.etag = quote_etag(hashlib.md5(content.encode()).hexdigest())
+            if hasattr(last_modified, "timestamp"):
+                self.last_modified = int(last_modified.timestamp())
+
+    @property
+    def cache_key(self):
+        return f"model_serializer:response:{self.etag}"
+
+    def get_response(self):
+        """
+        返回 304 响应或已缓存的响应，需要构造完整响应时返回 None
+        """
+        if self.etag is None:
+            return None
+
+        response = get_conditional_response(self.request, etag=self.etag, last_modified=self.last_modified)
+        if response is None and self.cache_timeout is not None:
+            content = self.cache.get(self.cache_key)
+            if content is not None:
+                response = CachedApiResponse(content)
+
+        if response is not None:
+            self._set_validators(response)
+        return response
+
+    def finalize(self, response):
+        """
+        为完整的响应加上 ETag / Last-Modified，并按需缓存响应内容
+        """
+        if self.etag is None or response.status_code != 200:
+            return response
+
+        if self.cache_timeout is not None and not response.streaming:
+            self.cache.set(self.cache_key, response.content, self.cache_timeout)
+        self._set_validators(response)
+        return response
+
+    def _set_validators(self, response):
+        response["ETag"] = self.etag
+        if self.last_modified is not None:
+            response["Last-Modified"] = http_date(self.last_modified)
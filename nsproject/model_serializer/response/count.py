@@ -0,0 +1,217 @@
+import time
+import hashlib
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections, close_old_connections
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete
+from django.utils.functional import cached_property
+
+from model_serializer.instrumentation import propagate_metrics
+from model_serializer.serializers.raw_json import without_raw_json
+
+# 分页总数的计算方式
+COUNT_EXACT = "exact"
+COUNT_CACHED = "cached"
+COUNT_APPROXIMATE = "approximate"
+
+COUNT_STRATEGIES = (COUNT_EXACT, COUNT_CACHED, COUNT_APPROXIMATE)
+
+# 缓存总数的默认过期时间（秒）
+DEFAULT_COUNT_TIMEOUT = 60
+# 并发查询总数使用的线程数
+DEFAULT_COUNT_WORKERS = 4
+
+# 第一次并发查询总数时创建，创建时持有 _count_executor_lock，避免同时到达的请求重复创建
+_count_executor = None
+_count_executor_lock = threading.Lock()
+# 已注册失效信号的 Model
+_watched_models = set()
+
+
+class CountPaginator(Paginator):
+    """
+    支持多种总数计算方式的 Paginator
+
+    * exact: SELECT COUNT(*)，与 Paginator 相同
+    * cached: 精确总数，按照查询的 SQL 及参数缓存在 Django cache 中，
+      对应的 Model 发生 post_save / post_delete 时失效
+    * approximate: 对于没有过滤条件的 QuerySet，使用 MySQL information_schema 中的行数估算值，
+      其他情况退化为 exact
+
+    count_exact 表示 count 是否为精确值。
+    """
+
+    def __init__(self, object_list, per_page, *, count_strategy=None, count_timeout=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        count_strategy = count_strategy or COUNT_EXACT
+        if count_strategy not in COUNT_STRATEGIES:
+            raise ValueError(f"不支持的 count 方式：{count_strategy}")
+        self.count_strategy = count_strategy
+        self.count_timeout = count_timeout
+        self.count_exact = True
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            # 以文本形式查询的 JSON 字段只用于序列化，COUNT 时去掉
+            queryset = without_raw_json(self.object_list)
+            if self.count_strategy == COUNT_CACHED:
+                return get_cached_count(queryset, timeout=self.count_timeout)
+
+            if self.count_strategy == COUNT_APPROXIMATE:
+                count = get_approximate_count(queryset)
+                if count is not None:
+                    self.count_exact = False
+                    return count
+
+            return queryset.count()
+
+        return super().count
+
+    def fetch_page(self, number, *, concurrent=False):
+        """
+        与 get_page() 相同，但先查询当前页的数据，而不是先查询总数：
+
+        * 当前页不满一页时，总数可以直接计算出来，不再执行 COUNT 查询
+        * concurrent 为 True 时，COUNT 在另一个线程（另一个数据库连接）中与当前页的查询同时执行
+
+        页码超出范围等情况，退化为 get_page()。
+        """
+        if not isinstance(self.object_list, QuerySet) or 'count' in self.__dict__:
+            return self.get_page(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            return self.get_page(number)
+        if number < 1:
+            return self.get_page(number)
+
+        future = None
+        if concurrent and not connections[self.object_list.db].in_atomic_block:
+            # 事务中未提交的数据对其他连接不可见，此时不能并发查询
+            future = _get_count_executor().submit(propagate_metrics(_count_in_thread), self)
+
+        bottom = (number - 1) * self.per_page
+        items = list(self.object_list[bottom:bottom + self.per_page])
+
+        if future is not None:
+            future.result()
+        elif (items and len(items) < self.per_page) or (not items and number == 1):
+            self.__dict__['count'] = bottom + len(items)
+
+        if not items and number > 1:
+            return self.get_page(number)
+        return self._get_page(items, number, self)
+
+
+def get_cached_count(queryset, *, timeout=None):
+    """
+    获取 queryset 的总数，结果按照 SQL 及参数缓存，缓存 key 中包含 Model 的版本号，
+    Model 发生 post_save / post_delete 时版本号变化，缓存随之失效。
+
+    注意：只有 queryset.model 的变化会使缓存失效，关联表的变化只能等待缓存过期。
+    失效信号在第一次获取该 Model 的缓存总数时才会注册，多进程部署时，
+    应在 settings.MODEL_SERIALIZER_CACHED_COUNT_MODELS 中列出这些 Model，启动时即注册。
+    """
+    watch_cached_count(queryset.model)
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.md5(f"{queryset.db}:{sql}:{params!r}".encode()).hexdigest()
+    version = _get_model_version(queryset.model)
+    key = f"model_serializer:count:{queryset.model._meta.label_lower}:{version}:{digest}"
+
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, DEFAULT_COUNT_TIMEOUT if timeout is None else timeout)
+    return count
+
+
+def get_approximate_count(queryset):
+    """
+    获取没有过滤条件的 queryset 的估算总数，无法估算时返回 None
+    """
+    query = queryset.query
+    if query.where or query.distinct or query.is_sliced or query.combinator or query.group_by is not None:
+        return None
+
+    connection = connections[queryset.db]
+    if connection.vendor != "mysql":
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT TABLE_ROWS FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+
+    if row is None or row[0] is None:
+        return None
+    return row[0]
+
+
+def _get_count_executor():
+    global _count_executor
+    if _count_executor is None:
+        with _count_executor_lock:
+            if _count_executor is None:
+                _count_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'MODEL_SERIALIZER_COUNT_WORKERS', DEFAULT_COUNT_WORKERS),
+                    thread_name_prefix='model_serializer_count',
+                )
+    return _count_executor
+
+
+def _count_in_thread(paginator):
+    # 执行前后都按照 CONN_MAX_AGE 关闭过期的连接，避免复用已被数据库断开的连接
+    close_old_connections()
+    try:
+        return paginator.count
+    finally:
+        close_old_connections()
+
+
+def _model_version_key(model):
+    return f"model_serializer:count_version:{model._meta.label_lower}"
+
+
+def watch_cached_count(model):
+    """
+    为 model 注册 post_save / post_delete 信号，使缓存的总数失效，重复调用不会重复注册
+
+    只为使用了缓存总数的 Model 注册：post_delete 有接收者的 Model 不能快速删除（fast delete）。
+    """
+    if model in _watched_models:
+        return
+
+    label = model._meta.label_lower
+    post_save.connect(_invalidate_cached_count, sender=model, dispatch_uid=f"model_serializer_count_post_save:{label}")
+    post_delete.connect(_invalidate_cached_count, sender=model,
+                        dispatch_uid=f"model_serializer_count_post_delete:{label}")
+    _watched_models.add(model)
+
+
+def _get_model_version(model):
+    # 版本号不存在（从未修改过或已被淘汰）时使用当前时间初始化，不会与被淘汰前的版本号相同，
+    # 避免读取到旧版本号下缓存的总数
+    key = _model_version_key(model)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def _invalidate_cached_count(sender, **kwargs):
+    key = _model_version_key(sender)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
@@ -0,0 +1,157 @@
+import io
+import csv
+import json
+import zlib
+
+from django.db.models import QuerySet
+from django.db.models.query import ModelIterable
+from django.http import StreamingHttpResponse
+from django.middleware.gzip import re_accepts_gzip
+
+from model_serializer.response.base import ResponseException
+from model_serializer.serializers import NativeSerializer
+from model_serializer.serializers import iter_serialized_chunks
+from model_serializer.serializers import json_backend_dumps
+from model_serializer.serializers.model import make_model_serializer
+from model_serializer.serializers.queryset import SerializedValuesIterable
+
+# 导出格式
+EXPORT_NDJSON = "ndjson"
+EXPORT_CSV = "csv"
+
+EXPORT_CONTENT_TYPES = {
+    EXPORT_NDJSON: "application/x-ndjson",
+    EXPORT_CSV: "text/csv; charset=utf-8",
+}
+
+
+class ExportResponse(StreamingHttpResponse, ResponseException):
+    """
+    导出数据的流式响应，每条数据一行，不包含 code / message 等外层结构
+
+    * ndjson: 每行一个 JSON 对象
+    * csv: 第一行为表头（序列化方案输出的字段名），嵌套的数据以 JSON 字符串输出
+
+    数据分块读取、序列化并输出，QuerySet 按照 keyset 分块读取，内存占用只与 chunk_size 有关；
+    无法使用 keyset 分块的 QuerySet 退化为 .iterator()，具体见 iter_queryset_chunks。
+    """
+
+    def __init__(self,
+                 *,
+                 data=None,
+                 format: str = EXPORT_NDJSON,
+                 serialize_profile=None,
+                 header=None,
+                 chunk_size: int = 2000,
+                 compress: bool = False,
+                 filename: str = None,
+                 ):
+        """
+        :param data: QuerySet 或任意可迭代对象。
+        :param format: 导出格式，"ndjson" 或 "csv"。
+        :param serialize_profile: 序列化方案配置。
+        :param header: csv 的表头，未指定时使用第一条数据的字段名。
+        :param chunk_size: 每次从数据库读取并序列化的数量。
+        :param compress: 是否使用 gzip 压缩输出。
+        :param filename: 若指定，将作为附件下载时的文件名。
+        """
+        if format not in EXPORT_CONTENT_TYPES:
+            raise ValueError(f"不支持的导出格式：{format}")
+
+        if format == EXPORT_CSV:
+            content = _iter_csv(data, serialize_profile, header, chunk_size)
+        else:
+            content = _iter_ndjson(data, serialize_profile, chunk_size)
+        if compress:
+            content = _gzip(content)
+
+        StreamingHttpResponse.__init__(self, streaming_content=content,
+                                       content_type=EXPORT_CONTENT_TYPES[format])
+        if compress:
+            self["Content-Encoding"] = "gzip"
+        if filename:
+            self["Content-Disposition"] = f'attachment; filename="{filename}"'
+        ResponseException.__init__(self, f'<ExportResponse format={format}>')
+
+
+def get_export_header(queryset, serialize_profile=None):
+    """
+    根据序列化方案获取 queryset 导出时的字段名，无法确定时返回 None
+
+    使用了 values() / values_list() 等的 queryset 不按序列化方案输出，返回 None。
+    """
+    if not isinstance(queryset, QuerySet) or not hasattr(queryset.model, 'Serializer'):
+        return None
+    iterable_class = queryset._iterable_class
+    if iterable_class is not ModelIterable and not issubclass(iterable_class, SerializedValuesIterable):
+        return None
+
+    options = serialize_profile[queryset.model] if serialize_profile is not None else {}
+    serializer = make_model_serializer(queryset.model, name=options.get('serializer'))
+    plan = serializer.get_plan(options.get('fields'), options.get('group'))
+    return list(plan.keys)
+
+
+def accepts_gzip(request):
+    """
+    请求的 Accept-Encoding 是否接受 gzip
+    """
+    return bool(re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+
+
+def _iter_rows(data, serialize_profile, chunk_size):
+    """
+    分块返回已转换为 JSON 原生类型的数据
+    """
+    native = NativeSerializer(serialize_profile)
+    for rows in iter_serialized_chunks(() if data is None else data, serialize_profile, chunk_size):
+        yield [native.convert(row) for row in rows]
+
+
+def _iter_ndjson(data, serialize_profile, chunk_size):
+    for rows in _iter_rows(data, serialize_profile, chunk_size):
+        yield b''.join(_to_bytes(json_backend_dumps(row)) + b'\n' for row in rows)
+
+
+def _iter_csv(data, serialize_profile, header, chunk_size):
+    buffer = io.StringIO()
+    writer = None
+
+    if header is not None:
+        writer = csv.DictWriter(buffer, fieldnames=header, restval='', extrasaction='ignore')
+        writer.writeheader()
+
+    for rows in _iter_rows(data, serialize_profile, chunk_size):
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(rows[0]) if isinstance(rows[0], dict) else [], restval='', extrasaction='ignore')
+            writer.writeheader()
+
+        writer.writerows(
+            {key: _csv_value(value) for key, value in row.items()} if isinstance(row, dict) else {}
+            for row in rows
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _to_bytes(content):
+    return content if isinstance(content, bytes) else content.encode()
+
+
+def _gzip(content):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in content:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -1,7 +1,15 @@
-from django.core.paginator import Paginator
+import json
+import base64
+import datetime
 
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
 
-def get_pagination(request, queryset, *, page=None, page_size=None, max_page_size=None, max_records=None):
+from model_serializer.response.count import CountPaginator
+
+
+def get_pagination(request, queryset, *, page=None, page_size=None, max_page_size=None, max_records=None,
+                   count=None, count_timeout=None, concurrent_count=False):
     """
     :param request: HttpRequest 对象。
     :param queryset: QuerySet 或者任意可迭代对象
@@ -9,6 +17,12 @@ def get_pagination(request, queryset, *, page=None, page_size=None, max_page_siz
     :param page_size: 每页展示的数量，如果提供了该参数，则使用指定值，否则使用 querystring 中 page_size 的值，默认为 10。
     :param max_page_size: 每页展示的最大数量，默认为 100
     :param max_records: 最多返回多少条记录数，防止恶意获取数据，默认 1000
+    :param count: 总数的计算方式，默认为 "exact"，即 SELECT COUNT(*)；
+      "cached" 为缓存的精确总数，Model 发生 post_save / post_delete 时失效；
+      "approximate" 对没有过滤条件的 QuerySet 使用 MySQL 的行数估算值，其他情况使用精确总数。
+    :param count_timeout: count="cached" 时缓存的过期时间（秒），默认为 60
+    :param concurrent_count: 是否在另一个线程中与当前页的查询同时执行 COUNT，
+      默认先查询当前页，不满一页时不再执行 COUNT，具体见 CountPaginator.fetch_page
 
     返回一个三元组：page，paginator，pagination
     page: django.core.paginator.Page 对象
@@ -16,6 +30,7 @@ def get_pagination(request, queryset, *, page=None, page_size=None, max_page_siz
     pagination: 一个字典，字段格式如下：
       {
         'total': int, 条目总数
+        'total_exact': bool, total 是否为精确值
         'page': int, 当前页码（页码从1开始）
         'page_size': int, 每页条目数量
         'last_page': int, 最后一页的页码
@@ -44,10 +59,11 @@ def get_pagination(request, queryset, *, page=None, page_size=None, max_page_siz
     if page * page_size > max_records > 0:
         page = max_records // page_size
 
-    paginator = Paginator(queryset, page_size)
-    paginator_page = paginator.get_page(page)
+    paginator = CountPaginator(queryset, page_size, count_strategy=count, count_timeout=count_timeout)
+    paginator_page = paginator.fetch_page(page, concurrent=concurrent_count)
     pagination = dict(
         total=paginator.count,
+        total_exact=paginator.count_exact,
         page=paginator_page.number,
         page_size=page_size,
         last_page=paginator.num_pages,
@@ -57,6 +73,144 @@ def get_pagination(request, queryset, *, page=None, page_size=None, max_page_siz
     return paginator_page, paginator, pagination
 
 
+def get_cursor_pagination(request, queryset, *, ordering, cursor=None, page_size=None, max_page_size=None):
+    """
+    游标分页（keyset pagination），翻页时使用 WHERE (created_at, id) < (...) 代替 OFFSET，
+    任意深度的翻页耗时都相同，不需要 max_records 限制。
+
+    :param request: HttpRequest 对象。
+    :param queryset: QuerySet 对象。
+    :param ordering: 排序字段，如 ("-created_at", "id")，字段的值不能为 NULL，
+      若不包含主键，将自动加入主键以保证顺序唯一，排序字段上应当建立索引。
+    :param cursor: 游标，如果提供了该参数，则使用指定值，否则使用 querystring 中 cursor 的值，默认为第一页。
+    :param page_size: 每页展示的数量，如果提供了该参数，则使用指定值，否则使用 querystring 中 page_size 的值，默认为 10。
+    :param max_page_size: 每页展示的最大数量，默认为 100
+
+    返回一个二元组：items，pagination
+    items: 当前页的数据列表
+    pagination: 一个字典，字段格式如下：
+      {
+        'page_size': int, 每页条目数量
+        'next': str, 下一页的游标，没有下一页时为 None
+        'prev': str, 上一页的游标，没有上一页时为 None
+      }
+    """
+    max_page_size = max_page_size or 100
+
+    if page_size and page_size > max_page_size:
+        raise ValueError(f"超过了最大允许的值{max_page_size},如有需求请提供 max_page_size 参数")
+
+    if page_size is None:
+        page_size = get_int(request, "page_size", 10)
+        if page_size > max_page_size:
+            page_size = max_page_size
+    if cursor is None:
+        cursor = request.GET.get("cursor")
+
+    ordering = _normalize_ordering(queryset.model, ordering)
+    aliases = [f"_cursor_{i}" for i in range(len(ordering))]
+    direction, values = _decode_cursor(cursor, len(ordering))
+    backwards = direction == "prev"
+    if values is not None:
+        try:
+            queryset = queryset.filter(_cursor_filter(ordering, values, backwards))
+        except (ValidationError, ValueError, TypeError):
+            # 游标中的值与字段类型不符（如被篡改），返回第一页
+            values, backwards = None, False
+
+    # 排序、过滤都使用原始字段，以便使用索引；annotate 的别名只用于读取游标的值
+    queryset = queryset.annotate(**{alias: F(name) for alias, (name, _) in zip(aliases, ordering)})
+    queryset = queryset.order_by(*[("-" if desc != backwards else "") + name for name, desc in ordering])
+
+    items = list(queryset[:page_size + 1])
+    has_more = len(items) > page_size
+    items = items[:page_size]
+    if backwards:
+        items.reverse()
+
+    # 向后翻页时多取的一条说明还有下一页，向前翻页时则说明还有上一页
+    if backwards:
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, values is not None
+
+    next_cursor = prev_cursor = None
+    if items and has_next:
+        next_cursor = _encode_cursor("next", _cursor_values(items[-1], aliases))
+    if items and has_prev:
+        prev_cursor = _encode_cursor("prev", _cursor_values(items[0], aliases))
+
+    pagination = dict(
+        page_size=page_size,
+        next=next_cursor,
+        prev=prev_cursor,
+    )
+    return items, pagination
+
+
+def _normalize_ordering(model, ordering):
+    """
+    将 ("-created_at", "id") 转换为 [("created_at", True), ("id", False)]，并确保包含主键
+    """
+    if isinstance(ordering, str):
+        ordering = (ordering,)
+    if not ordering:
+        raise ValueError("游标分页必须指定 ordering")
+
+    result = [(name[1:], True) if name.startswith("-") else (name, False) for name in ordering]
+    names = {name for name, _ in result}
+    if not names & {"pk", model._meta.pk.name}:
+        result.append((model._meta.pk.name, result[-1][1]))
+    return result
+
+
+def _cursor_filter(ordering, values, backwards):
+    """
+    生成 (a, b) > (x, y) 的等价条件：a > x OR (a = x AND b > y)，支持不同的排序方向
+    """
+    condition = Q()
+    equals = Q()
+    for (name, desc), value in zip(ordering, values):
+        lookup = "lt" if desc != backwards else "gt"
+        condition |= equals & Q(**{f"{name}__{lookup}": value})
+        equals &= Q(**{name: value})
+    return condition
+
+
+def _cursor_values(item, aliases):
+    if isinstance(item, dict):
+        return [item[alias] for alias in aliases]
+    return [getattr(item, alias) for alias in aliases]
+
+
+def _encode_cursor(direction, values):
+    def default(o):
+        if isinstance(o, (datetime.datetime, datetime.date, datetime.time)):
+            return o.isoformat()
+        return str(o)
+
+    content = json.dumps([direction, values], default=default, separators=(",", ":"))
+    return base64.urlsafe_b64encode(content.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor, size):
+    """
+    解析游标，返回 (direction, values)，游标为空或不合法时返回第一页，即 ("next", None)
+    """
+    if not cursor:
+        return "next", None
+
+    try:
+        content = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        direction, values = json.loads(content)
+    except (ValueError, TypeError):
+        return "next", None
+
+    if direction not in ("next", "prev") or not isinstance(values, list) or len(values) != size:
+        return "next", None
+    return direction, values
+
+
 def get_int(request, name, default=None, raise_on_value_error=False):
     """
     获取一个 int 类型的 querystring 参数
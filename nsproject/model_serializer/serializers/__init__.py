@@ -2,62 +2,116 @@ import json
 import datetime
 import uuid
 import decimal
+import itertools
 
 from collections import defaultdict
 
 from django.db.models import QuerySet, Model
 from django.core.paginator import Page as PaginatorPage
-from django.utils.timezone import is_aware, make_naive
 
+from model_serializer.serializers.converters import serialize_datetime
 from model_serializer.serializers.model import LazySerializeProfile
 from model_serializer.serializers.model import serialize_model
+from model_serializer.serializers.model import serialize_many
+from model_serializer.serializers.queryset import optimize_queryset
+from model_serializer.serializers.queryset import iter_queryset_chunks
+from model_serializer.serializers.cache import get_row_cache_config
+from model_serializer.serializers.cache import serialize_many_cached
+from model_serializer.serializers.cache import invalidate_row_cache
+from model_serializer.serializers.native import NativeSerializer
+from model_serializer.serializers.native import to_native
+from model_serializer.serializers.native import json_backend_dumps
+from model_serializer.serializers.raw_json import RawJSON
+from model_serializer.serializers.raw_json import RawJSONCollector
 
 __all__ = [
     'LazySerializeProfile',
     'serialize_model',
+    'serialize_many',
+    'serialize_objects',
+    'iter_serialized_chunks',
+    'iter_queryset_chunks',
+    'optimize_queryset',
+    'invalidate_row_cache',
+    'NativeSerializer',
+    'to_native',
+    'json_backend_dumps',
+    'RawJSON',
     'JSONEncoder',
     'json_dumps',
 ]
 
 
-def serialize_datetime(t=None, format=None):
-    if t is None:
-        return t
-
-    if isinstance(t, datetime.datetime):
-        if is_aware(t):
-            t = make_naive(t)
-        if not format:
-            format = '%Y-%m-%d %H:%M:%S'
-        return t.strftime(format)
-    elif isinstance(t, datetime.date):
-        if not format:
-            format = '%Y-%m-%d'
-        return t.strftime(format)
-    elif isinstance(t, datetime.time):
-        if not format:
-            format = '%H:%M:%S'
-        return t.strftime(format)
+def serialize_objects(objects, serialize_profile=None):
+    """
+    按照 serialize_profile 批量序列化 QuerySet、paginator.Page 或 model 实例列表
+
+    序列化参数根据第一个 model 实例的类型，从 serialize_profile 中获取一次。
+    若使用的 serializer 中声明了 CACHE，将使用行缓存，此时返回的数据均为 JSON 原生类型。
+    """
+    objects = list(objects)
+    if not objects or not isinstance(objects[0], Model):
+        return objects
+
+    ModelClass = objects[0].__class__
+    options = serialize_profile[ModelClass] if serialize_profile is not None else {}
+
+    # 行缓存只用于同一种 Model、没有额外序列化参数的情况
+    if (get_row_cache_config(ModelClass, options.get('serializer')) is not None
+            and options.keys() <= {'fields', 'group', 'serializer'}
+            and all(obj.__class__ is ModelClass for obj in objects)):
+        return serialize_many_cached(
+            objects,
+            lambda rows: json_dumps(rows, serialize_profile=serialize_profile),
+            fields=options.get('fields'),
+            group=options.get('group'),
+            serializer=options.get('serializer'),
+        )
+
+    return serialize_many(objects, **options)
+
+
+def iter_serialized_chunks(objects, serialize_profile=None, chunk_size=2000):
+    """
+    分块序列化 QuerySet 或任意可迭代对象，每次返回一块已序列化的数据（list）
+
+    QuerySet 按照 keyset 分块读取，不会一次性加载所有数据，具体见 iter_queryset_chunks；
+    prefetch_related 会在每一块数据上单独执行。
+    """
+    if isinstance(objects, QuerySet):
+        chunks = iter_queryset_chunks(objects, chunk_size)
     else:
-        raise TypeError('"t" is not valid datetime type.')
+        iterator = iter(objects)
+        chunks = iter(lambda: list(itertools.islice(iterator, chunk_size)), [])
+
+    for chunk in chunks:
+        yield serialize_objects(chunk, serialize_profile)
 
 
 class JSONEncoder(json.JSONEncoder):
     """
     扩展默认的 json.JSONEncoder，支持序列化 Model，以及一些我们内部达成一致的通用数据类型。
+
+    RawJSON 会原样拼接到 encode() 的结果中。
     """
 
     def __init__(self, *, serialize_profile=None, **kwargs):
         super().__init__(**kwargs)
         self.serialize_profile = serialize_profile or defaultdict(dict)
+        self.raw_json = RawJSONCollector()
+
+    def encode(self, o):
+        return self.raw_json.splice(super().encode(o))
 
     def default(self, o):
-        if isinstance(o, (datetime.date, datetime.datetime, datetime.time)):
+        if isinstance(o, RawJSON):
+            return self.raw_json.placeholder(o)
+        elif isinstance(o, (datetime.date, datetime.datetime, datetime.time)):
             return serialize_datetime(o)
         elif isinstance(o, (decimal.Decimal, uuid.UUID)):
             return str(o)
         elif isinstance(o, (PaginatorPage, QuerySet)):
-            return list(o)
+            return serialize_objects(o, self.serialize_profile)
         elif isinstance(o, Model):
             return serialize_model(o, **self.serialize_profile[o.__class__])
         elif hasattr(o, 'Serializer'):
@@ -0,0 +1,167 @@
+import json
+import time
+import hashlib
+
+from django.core.cache import caches
+from django.db.models.signals import post_save, post_delete, m2m_changed
+
+from model_serializer.serializers.model import make_model_serializer, get_serializer_names
+
+# 行缓存的默认过期时间（秒）
+DEFAULT_ROW_CACHE_TTL = 300
+# 行缓存 key 中使用的版本字段
+DEFAULT_ROW_CACHE_VERSION_FIELD = 'updated_at'
+
+# 已注册失效信号的 Model
+_watched_models = set()
+
+
+def get_row_cache_config(ModelClass, serializer=None):
+    """
+    获取 Model 上指定 serializer 的行缓存配置，未开启时返回 None
+
+    在 Serializer（或 ListSerializer 等命名的 serializer）中声明，只对声明它的 serializer 生效：
+        CACHE = {
+            "ttl": 300,                      # 过期时间（秒），默认 300
+            "alias": "default",              # 使用的 Django cache，默认 default
+            "version_field": "updated_at",   # 缓存 key 中包含的版本字段，默认 updated_at，不存在时忽略
+        }
+
+    :param serializer: serializer 类名称，如 ListSerializer，默认为 Serializer。
+    """
+    if not hasattr(ModelClass, 'Serializer'):
+        return None
+    return getattr(make_model_serializer(ModelClass, name=serializer), 'CACHE', None)
+
+
+def _get_row_cache_aliases(ModelClass):
+    # Model 上所有声明了 CACHE 的 serializer 使用的 Django cache
+    return {
+        getattr(ModelClass, name).CACHE.get('alias', 'default')
+        for name in get_serializer_names(ModelClass)
+        if getattr(getattr(ModelClass, name), 'CACHE', None) is not None
+    }
+
+
+def serialize_many_cached(instances, encode, *, fields=None, group=None, serializer=None):
+    """
+    使用行缓存批量序列化同一种 Model 的实例
+
+    每个实例的序列化结果按照 (model, pk, 序列化方案, 版本号, 版本字段) 缓存，版本号保存在 cache 中，
+    实例发生变化时增加，一页数据只需要两次 get_many，未命中的实例才会序列化。缓存的是 JSON 原生类型的数据，嵌套的关联对象已经按照 encode 序列化。
+
+    注意：关联对象的变化不会使缓存失效，只能等待缓存过期。
+
+    :param instances: 同一种 Model 的实例列表。
+    :param encode: 将序列化结果编码为 JSON 字符串的函数，用于转换嵌套的关联对象。
+    """
+    ModelClass = instances[0].__class__
+    config = get_row_cache_config(ModelClass, serializer)
+    cache = caches[config.get('alias', 'default')]
+    watch_row_cache(ModelClass)
+
+    plan = make_model_serializer(ModelClass, name=serializer).get_plan(fields, group)
+    versions = _get_row_versions(instances, cache)
+    keys = [_row_cache_key(instance, plan, config, version) for instance, version in zip(instances, versions)]
+    rows = cache.get_many(keys)
+
+    misses = [index for index, key in enumerate(keys) if key not in rows]
+    if misses:
+        serialized = plan.serialize_many([instances[index] for index in misses], ModelClass)
+        serialized = json.loads(encode(serialized))
+        missed_rows = {keys[index]: row for index, row in zip(misses, serialized)}
+        cache.set_many(missed_rows, config.get('ttl', DEFAULT_ROW_CACHE_TTL))
+        rows.update(missed_rows)
+
+    return [rows[key] for key in keys]
+
+
+def invalidate_row_cache(instances):
+    """
+    使实例在所有序列化方案下的行缓存失效
+
+    行缓存 key 中包含每个实例的版本号，这里只需要增加版本号，所有进程中的旧缓存都不会再被读取。
+    """
+    instances = list(instances)
+    if not instances:
+        return
+
+    # 版本号按实例保存，声明了 CACHE 的各个 serializer 共用，每个 cache 中各有一份
+    for alias in _get_row_cache_aliases(instances[0].__class__):
+        cache = caches[alias]
+        for instance in instances:
+            key = _row_version_key(instance)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, _new_row_version(), None)
+
+
+def watch_row_cache(ModelClass):
+    """
+    为任一 serializer 声明了 CACHE 的 Model 注册 post_save / post_delete / m2m_changed 信号，使行缓存失效，
+    重复调用不会重复注册
+
+    只为这些 Model 注册：post_delete 有接收者的 Model 不能快速删除（fast delete）。
+    """
+    if ModelClass in _watched_models or not _get_row_cache_aliases(ModelClass):
+        return
+
+    label = ModelClass._meta.label_lower
+    post_save.connect(_invalidate_on_change, sender=ModelClass,
+                      dispatch_uid=f'model_serializer_row_cache_post_save:{label}')
+    post_delete.connect(_invalidate_on_change, sender=ModelClass,
+                        dispatch_uid=f'model_serializer_row_cache_post_delete:{label}')
+    # m2m_changed 的 sender 为中间表
+    for f in ModelClass._meta.get_fields():
+        if f.many_to_many:
+            through = f.through if not f.concrete else f.remote_field.through
+            m2m_changed.connect(_invalidate_on_m2m_change, sender=through,
+                                dispatch_uid=f'model_serializer_row_cache_m2m_changed:{through._meta.label_lower}')
+    _watched_models.add(ModelClass)
+
+
+def _get_row_versions(instances, cache):
+    # 每个实例的版本号，不存在（从未修改过或已被淘汰）时使用当前时间初始化，不会与被淘汰前的版本号相同
+    keys = [_row_version_key(instance) for instance in instances]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, _new_row_version(), None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key) for key in keys]
+
+
+def _new_row_version():
+    return time.time_ns()
+
+
+def _row_version_key(instance):
+    return f'model_serializer:row_version:{instance._meta.label_lower}:{instance.pk}'
+
+
+def _row_cache_key(instance, plan, config, row_version):
+    # 版本字段只从已加载的数据中读取，避免触发延迟加载
+    version_field = config.get('version_field', DEFAULT_ROW_CACHE_VERSION_FIELD)
+    version = instance.__dict__.get(version_field)
+    if version is not None and hasattr(version, 'isoformat'):
+        version = version.isoformat()
+
+    digest = hashlib.md5(repr(plan.key).encode()).hexdigest()
+    return f'model_serializer:row:{instance._meta.label_lower}:{instance.pk}:{digest}:{row_version}:{version}'
+
+
+def _invalidate_on_change(sender, instance, **kwargs):
+    invalidate_row_cache([instance])
+
+
+def _invalidate_on_m2m_change(sender, instance, action, model, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+
+    invalidate_row_cache([instance])
+
+    # 另一端的实例同样发生了变化
+    if pk_set and _get_row_cache_aliases(model):
+        invalidate_row_cache(model._default_manager.filter(pk__in=pk_set))
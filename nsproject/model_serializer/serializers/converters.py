@@ -0,0 +1,98 @@
+import datetime
+
+from django.db import models
+from django.utils.timezone import is_aware, make_naive, get_current_timezone
+
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+DATE_FORMAT = '%Y-%m-%d'
+TIME_FORMAT = '%H:%M:%S'
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+# 时区偏移量按 15 分钟分桶缓存，现实中的时区切换都发生在 15 分钟的整数倍上
+_OFFSET_BUCKET = datetime.timedelta(minutes=15)
+_OFFSET_CACHE_SIZE = 1024
+# key 为 (时区, 分桶)，value 为该时间段内本地时间与 UTC 的偏移量
+_offsets = dict()
+
+
+def _make_naive(t, timezone):
+    """
+    与 django.utils.timezone.make_naive 结果相同，但时区偏移量按时间段缓存，避免每次都进行时区转换
+    """
+    utc = t.replace(tzinfo=None) - t.utcoffset()
+    key = (timezone, (utc - _EPOCH) // _OFFSET_BUCKET)
+    offset = _offsets.get(key)
+    if offset is None:
+        if len(_offsets) >= _OFFSET_CACHE_SIZE:
+            _offsets.clear()
+        offset = _offsets[key] = make_naive(t, timezone) - utc
+    return utc + offset
+
+
+def serialize_datetime(t=None, format=None):
+    if t is None:
+        return t
+
+    if isinstance(t, datetime.datetime):
+        if is_aware(t):
+            t = _make_naive(t, get_current_timezone())
+        if not format or format == DATETIME_FORMAT:
+            return t.isoformat(' ', 'seconds')
+        return t.strftime(format)
+    elif isinstance(t, datetime.date):
+        if not format or format == DATE_FORMAT:
+            return t.isoformat()
+        return t.strftime(format)
+    elif isinstance(t, datetime.time):
+        if (not format or format == TIME_FORMAT) and t.tzinfo is None:
+            return t.isoformat('seconds')
+        return t.strftime(format or TIME_FORMAT)
+    else:
+        raise TypeError('"t" is not valid datetime type.')
+
+
+def serialize_datetimes(values, format=None):
+    """
+    serialize_datetime 的批量版本，用于一次转换一整列数据
+    """
+    timezone = get_current_timezone()
+    result = []
+    append = result.append
+
+    for t in values:
+        if t is None:
+            append(t)
+        elif type(t) is datetime.datetime and (not format or format == DATETIME_FORMAT):
+            if t.tzinfo is not None:
+                t = _make_naive(t, timezone)
+            append(t.isoformat(' ', 'seconds'))
+        else:
+            append(serialize_datetime(t, format))
+
+    return result
+
+
+def serialize_str(value):
+    if value is None:
+        return value
+    return str(value)
+
+
+def serialize_strs(values):
+    """
+    serialize_str 的批量版本
+    """
+    return [None if value is None else str(value) for value in values]
+
+
+def get_column_converter(field):
+    """
+    获取 django Field 的批量转换函数，与 JSONEncoder 中的转换方式一致。
+    转换函数接受一列值，返回转换后的列表，不需要转换时返回 None。
+    """
+    if isinstance(field, (models.DateField, models.TimeField)):
+        return serialize_datetimes
+    if isinstance(field, (models.DecimalField, models.UUIDField)):
+        return serialize_strs
+    return None
@@ -1,18 +1,36 @@
+import time
 import warnings
+import threading
 import inspect
+import operator
+import functools
 
-from django.db.models import Model
+from asgiref.sync import async_to_sync
+from django.db.models import Model, JSONField
 from django.core.exceptions import FieldDoesNotExist
 
+from model_serializer.instrumentation import instrument_getter, is_profiling_fields
+from model_serializer.serializers.raw_json import RawJSON, raw_json_alias
+from model_serializer.serializers.parallel import evaluate_many, IO_BOUND, CPU_BOUND, ASYNC
+
+# Model 上默认的 serializer 类名称
+DEFAULT_SERIALIZER = 'Serializer'
+
+# 已编译的 serializer，key 为 (ModelClass, serializer 类名称)；
+# 只在持有 _compile_lock 时写入，编译完成后不再修改，读取时不需要加锁
+_compiled_serializers = dict()
+_compile_lock = threading.RLock()
+
 
 class LazySerializeProfile:
     """
-    用于简化版的序列化方式: api.ok(data, fields=xx, group=xx)
+    用于简化版的序列化方式: api.ok(data, fields=xx, group=xx, serializer=xx)
     """
 
-    def __init__(self, fields=None, group=None, **serialize_kwargs):
+    def __init__(self, fields=None, group=None, serializer=None, **serialize_kwargs):
         self.fields = fields
         self.group = group
+        self.serializer = serializer
         self.serialize_kwargs = serialize_kwargs
         # 当第一次被使用时，会记录其 model_class
         self.model_class = None
@@ -22,6 +40,8 @@ class LazySerializeProfile:
         if self.model_class is None:
             self.model_class = model_class
             self.mapping[model_class] = dict(fields=self.fields, group=self.group)
+            if self.serializer is not None:
+                self.mapping[model_class]['serializer'] = self.serializer
 
         if model_class in self.mapping:
             return {**self.mapping[model_class], **self.serialize_kwargs}
@@ -29,9 +49,135 @@ class LazySerializeProfile:
             return {}
 
 
-def serialize_model(model: Model, *, fields=None, group=None, **kwargs):
+class FieldGetter:
+    """
+    单个字段的取值函数
+
+    getter 只接受 instance 一个参数；若字段对应的是 serialize_{field}() 之类的方法，
+    keyword_args / takes_var_args 记录了该方法可以接受哪些序列化参数。
+    若 Model 上定义了 serialize_many_{field}() 类方法，batch 为其对应的 FieldGetter，
+    它的 getter 接受实例列表，返回与之一一对应的值列表；
+    async 序列化方法及 io_bound_fields / cpu_bound_fields 中的字段，batch 为并发计算各个实例的函数。
+    """
+    __slots__ = ('getter', 'keyword_args', 'takes_var_args', 'batch')
+
+    def __init__(self, getter, keyword_args=(), takes_var_args=False, batch=None):
+        self.getter = getter
+        self.keyword_args = tuple(keyword_args)
+        self.takes_var_args = takes_var_args
+        self.batch = batch
+
+    def bind(self, kwargs):
+        """
+        将序列化参数绑定到取值函数上，返回一个只接受 instance 的函数
+        """
+        if not kwargs:
+            return self.getter
+        if self.takes_var_args:
+            return functools.partial(self.getter, **kwargs)
+        args = {key: kwargs[key] for key in self.keyword_args if key in kwargs}
+        if not args:
+            return self.getter
+        return functools.partial(self.getter, **args)
+
+    def __call__(self, instance, **kwargs):
+        return self.bind(kwargs)(instance)
+
+
+class SerializePlan:
+    """
+    针对某一组 (fields, group) 预先解析好的序列化方案
+
+    创建时完成字段校验、group 合并、{field}@{method} 的拆分，
+    序列化每个实例时只需要遍历 (key, getter)。
+    """
+    __slots__ = ('key', 'label', 'serializer', 'fields', 'keys', 'model_fields', '_field_getters', '_getters')
+
+    def __init__(self, key, fields, field_getters, model_fields, label='', serializer=DEFAULT_SERIALIZER):
+        self.key = key
+        # Model 的名称，用于耗时统计
+        self.label = label
+        # 方案所属的 serializer 类名称
+        self.serializer = serializer
+        # fields 为声明时的字段名（可能包含 @method），keys 为输出时使用的字段名
+        self.fields = tuple(fields)
+        self.keys = tuple(field.split('@', 1)[0] for field in self.fields)
+        # 与 fields 一一对应，直接读取 model 字段时为 django Field，否则为 None
+        self.model_fields = tuple(model_fields)
+        self._field_getters = tuple(field_getters)
+        self._getters = tuple(zip(self.keys, (g.bind(None) for g in self._field_getters)))
+
+    @property
+    def relations(self):
+        """
+        返回 ((field, django Field), ...)，即需要访问关联对象的字段
+        """
+        return tuple(
+            (field, f) for field, f in zip(self.fields, self.model_fields)
+            if f is not None and f.is_relation and f.related_model is not None
+        )
+
+    def bind(self, kwargs=None):
+        """
+        返回 ((key, getter), ...)，其中 getter 只接受 instance 一个参数
+        """
+        if not kwargs:
+            getters = self._getters
+        else:
+            getters = tuple(zip(self.keys, (g.bind(kwargs) for g in self._field_getters)))
+
+        if is_profiling_fields():
+            getters = tuple((key, instrument_getter(self.label, key, getter)) for key, getter in getters)
+        return getters
+
+    def bind_many(self, instances, model_class, kwargs=None):
+        """
+        与 bind() 相同，但定义了 serialize_many_{field}() 的字段会对 instances 中
+        所有 model_class 的实例一次性计算，getter 直接返回计算好的值
+        """
+        getters = self.bind(kwargs)
+        batch_fields = [
+            (key, g.batch) for key, g in zip(self.keys, self._field_getters) if g.batch is not None
+        ]
+        if not batch_fields:
+            return getters
+
+        targets = [instance for instance in instances if instance.__class__ is model_class]
+        batched = dict()
+        for key, batch in batch_fields:
+            values = list(instrument_getter(self.label, key, batch.bind(kwargs))(targets))
+            if len(values) != len(targets):
+                raise ValueError(
+                    f'{model_class.__name__}.serialize_many_{key}() 返回的数量与实例数量不一致：'
+                    f'{len(values)} != {len(targets)}'
+                )
+            values = {id(instance): value for instance, value in zip(targets, values)}
+            batched[key] = functools.partial(_get_batched_value, values)
+
+        return tuple((key, batched.get(key, getter)) for key, getter in getters)
+
+    def serialize(self, instance, **kwargs):
+        return {key: getter(instance) for key, getter in self.bind(kwargs)}
+
+    def serialize_many(self, instances, model_class, **kwargs):
+        """
+        批量序列化，只有 model_class 的实例会被序列化，其他对象原样返回
+        """
+        getters = self.bind_many(instances, model_class, kwargs)
+        return [
+            {key: getter(instance) for key, getter in getters}
+            if instance.__class__ is model_class else instance
+            for instance in instances
+        ]
+
+
+def _get_batched_value(values, instance):
+    return values[id(instance)]
+
+
+def serialize_model(model: Model, *, fields=None, group=None, serializer=None, **kwargs):
     if hasattr(model.__class__, 'Serializer'):
-        model._serializer = make_model_serializer(model.__class__)  # type: ignore
+        model._serializer = make_model_serializer(model.__class__, name=serializer)  # type: ignore
         return model._serializer.serialize(model, fields=fields, group=group, **kwargs)  # type: ignore
 
     # 对于既没有定义 Serializer，也没有 serialize() 的情况，我们添加一个默认的 Serialize
@@ -46,13 +192,96 @@ def serialize_model(model: Model, *, fields=None, group=None, **kwargs):
     return model._serializer.serialize(model, fields=None, group=None, **kwargs)
 
 
-def make_model_serializer(ModelClass, SerializerClass=None):
-    Serializer = SerializerClass or ModelClass.Serializer
+def serialize_many(instances, *, fields=None, group=None, serializer=None, **kwargs):
+    """
+    批量序列化同一种 Model 的实例
+
+    serializer 与序列化方案只解析一次，返回 dict 列表。
+    与第一个实例不是同一种 Model 的对象会原样保留，交给 JSONEncoder 处理。
+
+    :param instances: QuerySet、paginator.Page 或 model 实例列表。
+    :param serializer: 使用的 serializer 类名称，如 ListSerializer，默认为 Serializer。
+    """
+    instances = list(instances)
+    if not instances or not isinstance(instances[0], Model):
+        return instances
+
+    ModelClass = instances[0].__class__
+    if not hasattr(ModelClass, 'Serializer'):
+        return [serialize_model(instance, fields=fields, group=group, **kwargs) for instance in instances]
+
+    plan = make_model_serializer(ModelClass, name=serializer).get_plan(fields, group)
+    return plan.serialize_many(instances, ModelClass, **kwargs)
+
+
+def compile_model_serializers(model_classes):
+    """
+    预先编译定义了 Serializer 的 Model（包括 ListSerializer 等其他命名的 serializer），
+    并为默认字段及每个 field_groups 生成序列化方案，字段声明错误会在此时抛出异常。
+
+    返回一个字典，key 为 ModelClass，value 为编译耗时（秒）
+    """
+    timings = dict()
+    for ModelClass in model_classes:
+        if not hasattr(ModelClass, 'Serializer'):
+            continue
+
+        start = time.perf_counter()
+        for name in get_serializer_names(ModelClass):
+            serializer = make_model_serializer(ModelClass, name=name)
+            serializer.get_plan()
+            for group in serializer.field_groups:
+                serializer.get_plan(group=group)
+        timings[ModelClass] = time.perf_counter() - start
+
+    return timings
+
+
+def get_serializer_names(ModelClass):
+    """
+    返回 Model 上定义的 serializer 类名称：Serializer，以及 ListSerializer 等以 Serializer 结尾的内部类
+    """
+    return [
+        name for name in dir(ModelClass)
+        if name.endswith(DEFAULT_SERIALIZER) and inspect.isclass(getattr(ModelClass, name, None))
+    ]
+
+
+def make_model_serializer(ModelClass, SerializerClass=None, *, name=None):
+    """
+    返回编译后的 serializer，每个 (ModelClass, name) 在进程中只编译一次
 
-    if hasattr(Serializer, "_instance"):
-        return Serializer._instance
+    编译在锁中进行，编译完成后的读取不需要加锁；编译不会修改 Model 上的 serializer 类。
 
-    if hasattr(ModelClass, "serialize"):
+    :param ModelClass: Model 类。
+    :param SerializerClass: 直接指定 serializer 类，此时按其类名缓存。
+    :param name: Model 上 serializer 类的名称，如 ListSerializer，默认为 Serializer。
+    """
+    if SerializerClass is not None:
+        name = SerializerClass.__name__
+    elif name is None:
+        name = DEFAULT_SERIALIZER
+
+    key = (ModelClass, name)
+    serializer = _compiled_serializers.get(key)
+    if serializer is not None:
+        return serializer
+
+    with _compile_lock:
+        serializer = _compiled_serializers.get(key)
+        if serializer is None:
+            if SerializerClass is None:
+                SerializerClass = getattr(ModelClass, name, None)
+                if not inspect.isclass(SerializerClass):
+                    raise ValueError(f'{ModelClass.__name__} 没有定义 serializer：{name}')
+            serializer = _compile_model_serializer(ModelClass, SerializerClass, name)
+            _compiled_serializers[key] = serializer
+
+    return serializer
+
+
+def _compile_model_serializer(ModelClass, Serializer, name):
+    if name == DEFAULT_SERIALIZER and hasattr(ModelClass, "serialize"):
         warnings.warn(
             f"{ModelClass.__name__} 同时定义了 Serializer 和 serialize()，serialize() 函数将被忽略"
         )
@@ -60,23 +289,27 @@ def make_model_serializer(ModelClass, SerializerClass=None):
     if hasattr(Serializer, "serialize"):
         raise ValueError(
             '请勿在 Serializer 类上定义 serialize 函数或属性：'
-            f'{ModelClass.__name__}.Serializer'
+            f'{ModelClass.__name__}.{name}'
         )
 
     class CompiledSerializer(Serializer):
         def __init__(self):
             cls = self.__class__
-
-            if not hasattr(cls, 'default_fields'):
-                cls.default_fields = []
-            if not hasattr(cls, 'optional_fields'):
-                cls.optional_fields = []
-            if not hasattr(cls, 'field_groups'):
-                cls.field_groups = {}
+            self.name = name
+
+            # 字段声明复制到实例上，不修改 Model 上的 serializer 类
+            self.default_fields = list(getattr(cls, 'default_fields', ()))
+            self.optional_fields = list(getattr(cls, 'optional_fields', ()))
+            self.field_groups = {group: list(v) for group, v in getattr(cls, 'field_groups', {}).items()}
+            # 以文本形式查询、编码时原样输出的 JSONField
+            self.raw_json_fields = list(getattr(cls, 'raw_json_fields', ()))
+            # 批量序列化时并发计算的字段：I/O 密集的在线程池中执行，CPU 密集的在进程池中执行
+            self.io_bound_fields = list(getattr(cls, 'io_bound_fields', ()))
+            self.cpu_bound_fields = list(getattr(cls, 'cpu_bound_fields', ()))
 
             # 如果 INCLUDE_PRIMARY_KEY 为 True，则自动加入 pk
             if getattr(cls, 'INCLUDE_PRIMARY_KEY', True):
-                cls.default_fields.append(ModelClass._meta.pk.name)
+                self.default_fields.append(ModelClass._meta.pk.name)
 
             # 如果 INCLUDE_TIMESTAMP 为 True，则自动加入时间戳字段
             if getattr(cls, 'INCLUDE_TIMESTAMP', True):
@@ -84,7 +317,7 @@ def make_model_serializer(ModelClass, SerializerClass=None):
                 # created_at, updated_at，如果不存在，不会报错。
                 # 另一种情况是用户提供了 TIMESTAMP_FIELDS，则相应的字段必须存在。
                 if hasattr(cls, 'TIMESTAMP_FIELDS'):
-                    cls.default_fields.extend(cls.TIMESTAMP_FIELDS)
+                    self.default_fields.extend(cls.TIMESTAMP_FIELDS)
                     TIMESTAMP_FIELDS_AUTO = []
                 else:
                     TIMESTAMP_FIELDS_AUTO = ['created_at', 'updated_at']
@@ -93,18 +326,18 @@ def make_model_serializer(ModelClass, SerializerClass=None):
 
             # 计算所有可能的字段
             fields = set()
-            fields.update(cls.default_fields)
-            fields.update(cls.optional_fields)
-            for v in cls.field_groups.values():
+            fields.update(self.default_fields)
+            fields.update(self.optional_fields)
+            for v in self.field_groups.values():
                 fields.update(v)
 
-            # 检查这些字段是否存在，并生成一个字典，key 为字段值，value 为 serialize() 函数
-            cls.fields = dict()
-
-            def attribute_serializer(attr):
-                def getter(obj, **kwargs):
-                    return getattr(obj, attr)
-                return getter
+            # 检查这些字段是否存在，并生成一个字典，key 为字段值，value 为 FieldGetter
+            self.fields = dict()
+            # 直接读取 model 字段的 field，key 为字段名，value 为 django Field
+            self.model_fields = dict()
+            # 已解析的序列化方案，key 为 (fields, group)，只在持有 _plans_lock 时写入
+            self._plans = dict()
+            self._plans_lock = threading.Lock()
 
             for field in fields:
                 # 有些情况下，一个字段需要根据不同场合使用不同的序列化方式，我们可以为其指定一个函数，
@@ -116,53 +349,132 @@ def make_model_serializer(ModelClass, SerializerClass=None):
                         raise ValueError(
                             f'字段 {field} 没有实现相应的序列化方法：{method_name}'
                         )
-                    cls.fields[field] = self._create_method_serializer(ModelClass, method_name)
+                    self.fields[field] = self._create_method_serializer(ModelClass, method_name)
                     continue
 
+                # 如果存在 serialize_many_field() 类方法，批量序列化时对一页数据只调用一次，
+                # 没有 serialize_field() 时，单个实例的序列化也通过该方法完成
+                batch = None
+                if hasattr(ModelClass, f'serialize_many_{field}'):
+                    batch = self._create_batch_serializer(ModelClass, f'serialize_many_{field}')
+
                 # 如果存在 serialize_field() 方法，则使用该方法
                 if hasattr(ModelClass, f'serialize_{field}'):
                     method_name = f'serialize_{field}'
-                    cls.fields[field] = self._create_method_serializer(ModelClass, method_name)
+                    self.fields[field] = self._create_method_serializer(ModelClass, method_name)
+                    if batch is not None:
+                        self.fields[field].batch = batch
+                    continue
+
+                if batch is not None:
+                    self.fields[field] = self._create_single_from_batch_serializer(batch)
                     continue
 
                 try:
                     f = ModelClass._meta.get_field(field)
-                    if f.many_to_many or f.one_to_many:
+                    if field in self.raw_json_fields:
+                        if not isinstance(f, JSONField):
+                            raise ValueError(f'raw_json_fields 中的字段必须是 JSONField：{field}')
+                        self.fields[field] = self._create_raw_json_serializer(field)
+                    elif f.many_to_many or f.one_to_many:
                         # ManyToManyField, ForeignKey 的反向引用，需要使用 .all() 来访问
-                        cls.fields[field] = self._create_many_relation_serializer(field)
+                        self.fields[field] = self._create_many_relation_serializer(field)
                     else:
                         # 其他则直接返回值本身
-                        cls.fields[field] = self._create_attribute_serializer(field)
+                        self.fields[field] = self._create_attribute_serializer(field)
+                    self.model_fields[field] = f
                     continue
                 except FieldDoesNotExist:
                     pass
 
                 if hasattr(ModelClass, field):
                     # 否则看 ModelClass 上是否存在相应的 property
-                    cls.fields[field] = self._create_attribute_serializer(field)
+                    self.fields[field] = self._create_attribute_serializer(field)
                     continue
 
                 raise Exception(f'{ModelClass.__name__} 无法序列化该字段：{field}')
 
+            for field in self.raw_json_fields:
+                if field not in self.model_fields:
+                    raise ValueError(f'raw_json_fields 中的字段没有声明为序列化字段：{field}')
+
+            for bound, bound_fields in ((IO_BOUND, self.io_bound_fields), (CPU_BOUND, self.cpu_bound_fields)):
+                for field in bound_fields:
+                    self.fields[field] = self._create_bound_serializer(ModelClass, field, bound)
+
             for field in TIMESTAMP_FIELDS_AUTO:
                 # 对于时间戳字段，也允许自定义 serialize_{field}()，以便在特定场景下使用自定义的格式
                 if hasattr(Model, f'serialize_{field}'):
                     method_name = f'serialize_{field}'
-                    cls.default_fields.append(field)
-                    cls.fields[field] = self._create_method_serializer(Model, method_name)
+                    self.default_fields.append(field)
+                    self.fields[field] = self._create_method_serializer(Model, method_name)
 
                 elif hasattr(ModelClass, field):
-                    cls.default_fields.append(field)
-                    cls.fields[field] = self._create_attribute_serializer(field)
+                    self.default_fields.append(field)
+                    self.fields[field] = self._create_attribute_serializer(field)
+                    try:
+                        self.model_fields[field] = ModelClass._meta.get_field(field)
+                    except FieldDoesNotExist:
+                        pass
 
         def _create_method_serializer(self, Model, method_name):
             method = getattr(Model, method_name)
-            parameters = inspect.signature(method).parameters
+            keyword_args, takes_var_args = self._parse_method_parameters(
+                Model, method_name, list(inspect.signature(method).parameters.values()),
+            )
+            if inspect.iscoroutinefunction(method):
+                # async def 定义的序列化方法：单个实例同步等待其结果，批量序列化时使用 asyncio 并发执行
+                batch = FieldGetter(functools.partial(evaluate_many, method, ASYNC), keyword_args, takes_var_args)
+                return FieldGetter(async_to_sync(method), keyword_args, takes_var_args, batch)
+            return FieldGetter(method, keyword_args, takes_var_args)
+
+        def _create_bound_serializer(self, Model, field, bound):
+            getter = self.fields.get(field)
+            if getter is None:
+                raise ValueError(f'{bound}_bound_fields 中的字段没有声明为序列化字段：{field}')
+            if getter.batch is not None:
+                raise ValueError(
+                    f'{bound}_bound_fields 中的字段已经定义了 serialize_many_{field}() 或 async 序列化方法：{field}'
+                )
+            if bound == CPU_BOUND and not (inspect.isfunction(getter.getter) and hasattr(Model, getter.getter.__name__)):
+                # 进程池中执行的函数需要可以 pickle
+                raise ValueError(f'cpu_bound_fields 中的字段必须使用 Model 上的序列化方法：{field}')
+
+            batch = FieldGetter(
+                functools.partial(evaluate_many, getter.getter, bound), getter.keyword_args, getter.takes_var_args,
+            )
+            return FieldGetter(getter.getter, getter.keyword_args, getter.takes_var_args, batch)
+
+        def _create_batch_serializer(self, Model, method_name):
+            method = getattr(Model, method_name)
+            if not inspect.ismethod(method):
+                raise ValueError(
+                    f'批量序列化函数必须是 classmethod：{Model.__name__}.{method_name}()'
+                )
+
+            # 第一个参数为实例列表
+            parameters = list(inspect.signature(method).parameters.values())
+            if not parameters or parameters[0].kind not in (
+                    inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD):
+                raise ValueError(
+                    f'批量序列化函数的第一个参数必须是实例列表：{Model.__name__}.{method_name}()'
+                )
+
+            keyword_args, takes_var_args = self._parse_method_parameters(Model, method_name, parameters[1:])
+            return FieldGetter(method, keyword_args, takes_var_args)
+
+        def _create_single_from_batch_serializer(self, batch):
+            def serializer(instance, **kwargs):
+                return batch.getter([instance], **kwargs)[0]
+
+            return FieldGetter(serializer, batch.keyword_args, batch.takes_var_args, batch)
 
+        def _parse_method_parameters(self, Model, method_name, parameters):
             keyword_args = []
             takes_var_args = False
 
-            for name, param in parameters.items():
+            for param in parameters:
+                name = param.name
                 if name == 'self':
                     continue
                 if param.kind == param.POSITIONAL_ONLY or param.kind == param.VAR_POSITIONAL:
@@ -175,57 +487,82 @@ def make_model_serializer(ModelClass, SerializerClass=None):
                     continue
                 keyword_args.append(name)
 
-            def serializer(instance, **kwargs):
-                if takes_var_args:
-                    return method(instance, **kwargs)
-                else:
-                    args = {key: kwargs.pop(key) for key in keyword_args if key in kwargs}
-                    return method(instance, **args)
-
-            return serializer
+            return keyword_args, takes_var_args
 
         def _create_attribute_serializer(self, attr_name):
-            def serializer(instance, **kwargs):
-                return getattr(instance, attr_name)
+            return FieldGetter(operator.attrgetter(attr_name))
 
-            return serializer
+        def _create_raw_json_serializer(self, field_name):
+            # 查询时通过 annotate 以文本形式读取了该字段，则直接返回原始文本，否则返回解析后的值
+            alias = raw_json_alias(field_name)
+            get_value = operator.attrgetter(field_name)
+
+            def serializer(instance):
+                try:
+                    text = instance.__dict__[alias]
+                except KeyError:
+                    return get_value(instance)
+                return None if text is None else RawJSON(text)
+
+            return FieldGetter(serializer)
 
         def _create_many_relation_serializer(self, field_name):
-            def serializer(instance, **kwargs):
-                return getattr(instance, field_name).all()
+            get_manager = operator.attrgetter(field_name)
 
-            return serializer
+            def serializer(instance):
+                return get_manager(instance).all()
 
-        def serialize(self, instance: Model, fields=None, group=None, **kwargs):
-            # serialize_fields 为实际需要返回的字段集合
+            return FieldGetter(serializer)
+
+        def get_plan(self, fields=None, group=None):
+            """
+            获取 (fields, group) 对应的序列化方案，同一组参数只会解析一次
+            """
+            key = (tuple(fields) if fields else (), group or None)
+            try:
+                return self._plans[key]
+            except KeyError:
+                pass
+
+            with self._plans_lock:
+                try:
+                    return self._plans[key]
+                except KeyError:
+                    pass
+                plan = self._make_plan(key, fields, group)
+                self._plans[key] = plan
+            return plan
+
+        def _make_plan(self, key, fields, group):
+            # serialize_fields 为实际需要返回的字段，按声明顺序去重
             # 包括：
             #   * Serializer.default_fields 指定的字段
             #   * 参数 fields 指定的字段
             #   * 参数 groups 指定的字段
-            serialize_fields = set(self.default_fields)
+            serialize_fields = dict.fromkeys(self.default_fields)
 
             if fields:
                 for field in fields:
                     if field not in self.fields:
                         raise ValueError(f'指定的 field 不存在或不允许序列化：{field}')
-                    serialize_fields.add(field)
+                    serialize_fields[field] = None
 
             if group:
                 if group not in self.field_groups:
                     raise ValueError(f'指定的 group 不存在：{group}')
-                serialize_fields.update(self.field_groups[group])
+                serialize_fields.update(dict.fromkeys(self.field_groups[group]))
+
+            return SerializePlan(
+                # 默认 serializer 的方案 key 保持为 (fields, group)，其他 serializer 加上名称以示区分
+                key if name == DEFAULT_SERIALIZER else key + (name,),
+                serialize_fields,
+                [self.fields[field] for field in serialize_fields],
+                [self.model_fields.get(field) for field in serialize_fields],
+                label=ModelClass.__name__,
+                serializer=name,
+            )
 
-            result = {}
-            for field in serialize_fields:
-                data = self.fields[field](instance, **kwargs)
-
-                if '@' in field:
-                    raw_field, _ = field.split('@', 1)
-                    result[raw_field] = data
-                else:
-                    result[field] = data
-
-            return result
+        def serialize(self, instance: Model, fields=None, group=None, **kwargs):
+            return self.get_plan(fields, group).serialize(instance, **kwargs)
 
-    Serializer._instance = CompiledSerializer()
-    return Serializer._instance
+    return CompiledSerializer()
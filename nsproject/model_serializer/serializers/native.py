@@ -0,0 +1,176 @@
+import json
+import uuid
+import decimal
+import datetime
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.paginator import Page as PaginatorPage
+from django.db.models import QuerySet, Model
+from django.utils.module_loading import import_string
+
+from model_serializer.serializers.converters import serialize_datetime, get_column_converter
+from model_serializer.serializers.model import make_model_serializer, serialize_model
+from model_serializer.serializers.cache import get_row_cache_config, serialize_many_cached
+from model_serializer.serializers.raw_json import RawJSON, RawJSONCollector
+
+# 已经是 JSON 原生类型，不需要转换
+_PRIMITIVE_TYPES = frozenset((str, int, float, bool, type(None)))
+# 需要按照值的实际类型递归转换的字段（serialize_*() 方法、property、关联字段）
+_CONVERT = object()
+# 已计算好的字段转换函数，key 为 (ModelClass, plan.key)，value 为与 plan.keys 一一对应的元组
+_field_converters = dict()
+
+
+class NativeSerializer:
+    """
+    将数据直接序列化为 JSON 原生类型（dict、list、str、int、float、bool、None），
+    编码时不再需要 JSONEncoder.default() 回调，可以完全使用 C 实现的 json.dumps，或者更快的 JSON 库。
+
+    model 字段按照序列化方案中记录的 django Field 类型直接转换，关联对象递归序列化，
+    序列化参数的获取方式与 JSONEncoder 相同。
+
+    提供 raw_json 时，RawJSON 转换为占位字符串，编码后需要调用 raw_json.splice() 替换为原始文本；
+    否则 RawJSON 会被解析为 Python 对象。
+    """
+
+    def __init__(self, serialize_profile=None, raw_json=None):
+        self.serialize_profile = serialize_profile or defaultdict(dict)
+        self.raw_json = raw_json
+
+    def convert(self, value):
+        value_type = type(value)
+        if value_type in _PRIMITIVE_TYPES:
+            return value
+        if value_type is dict:
+            return {key: self.convert(v) for key, v in value.items()}
+        if value_type is list or value_type is tuple:
+            if value and isinstance(value[0], Model):
+                return self.serialize_many(value)
+            return [self.convert(v) for v in value]
+
+        if value_type is RawJSON:
+            return self.raw_json.placeholder(value) if self.raw_json is not None else value.load()
+        if isinstance(value, Model):
+            return self.serialize_many([value])[0]
+        elif isinstance(value, (PaginatorPage, QuerySet)):
+            return self.serialize_many(value)
+        elif isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+            return serialize_datetime(value)
+        elif isinstance(value, (decimal.Decimal, uuid.UUID)):
+            return str(value)
+        elif isinstance(value, dict):
+            return {key: self.convert(v) for key, v in value.items()}
+        elif isinstance(value, (list, tuple)):
+            return [self.convert(v) for v in value]
+
+        # 其他类型原样返回，由 JSON 库决定是否支持
+        return value
+
+    def serialize_many(self, objects):
+        """
+        批量序列化 QuerySet、paginator.Page 或 model 实例列表，序列化参数只获取一次
+        """
+        objects = list(objects)
+        if not objects or not isinstance(objects[0], Model):
+            return [self.convert(obj) for obj in objects]
+
+        ModelClass = objects[0].__class__
+        options = dict(self.serialize_profile[ModelClass])
+
+        if not hasattr(ModelClass, 'Serializer'):
+            return [self.convert(serialize_model(obj, **options)) for obj in objects]
+
+        fields, group = options.pop('fields', None), options.pop('group', None)
+        serializer = options.pop('serializer', None)
+
+        if (get_row_cache_config(ModelClass, serializer) is not None and not options
+                and all(obj.__class__ is ModelClass for obj in objects)):
+            return serialize_many_cached(objects, self.encode, fields=fields, group=group, serializer=serializer)
+
+        plan = make_model_serializer(ModelClass, name=serializer).get_plan(fields, group)
+        converters = get_field_converters(ModelClass, plan)
+        entries = tuple(
+            (key, getter, converter is _CONVERT)
+            for (key, getter), converter in zip(plan.bind_many(objects, ModelClass, options), converters)
+        )
+
+        convert = self.convert
+        rows = []
+        model_rows = []
+        for instance in objects:
+            if instance.__class__ is not ModelClass:
+                rows.append(convert(instance))
+                continue
+
+            row = {}
+            for key, getter, need_convert in entries:
+                row[key] = convert(getter(instance)) if need_convert else getter(instance)
+            rows.append(row)
+            model_rows.append(row)
+
+        # 类型已知的列（日期时间、Decimal、UUID）按列批量转换
+        for key, converter in zip(plan.keys, converters):
+            if converter is None or converter is _CONVERT:
+                continue
+            for row, value in zip(model_rows, converter([row[key] for row in model_rows])):
+                row[key] = value
+
+        return rows
+
+    def encode(self, value):
+        raw_json = RawJSONCollector()
+        content = json_backend_dumps(NativeSerializer(self.serialize_profile, raw_json).convert(value))
+        return raw_json.splice(content)
+
+
+def get_field_converters(ModelClass, plan):
+    """
+    根据序列化方案中记录的 django Field 类型，计算每个字段的转换方式：
+    None 表示不需要转换，_CONVERT 表示需要按照值的实际类型转换，其他为批量转换函数
+    """
+    key = (ModelClass, plan.key)
+    try:
+        return _field_converters[key]
+    except KeyError:
+        pass
+
+    raw_json_fields = make_model_serializer(ModelClass, name=plan.serializer).raw_json_fields
+    converters = []
+    for field, f in zip(plan.fields, plan.model_fields):
+        if f is None or f.is_relation or not f.concrete or field in raw_json_fields:
+            converters.append(_CONVERT)
+        else:
+            converters.append(get_column_converter(f))
+
+    converters = tuple(converters)
+    _field_converters[key] = converters
+    return converters
+
+
+def to_native(value, serialize_profile=None):
+    """
+    将 value 转换为 JSON 原生类型，model 实例、QuerySet 等按照 serialize_profile 序列化
+    """
+    return NativeSerializer(serialize_profile).convert(value)
+
+
+_json_backends = dict()
+
+
+def json_backend_dumps(value):
+    """
+    使用 settings.MODEL_SERIALIZER_JSON_BACKEND 指定的函数（如 "orjson.dumps"）编码 JSON 原生类型的数据，
+    未指定时使用标准库的 json.dumps，返回 str 或 bytes
+    """
+    path = getattr(settings, 'MODEL_SERIALIZER_JSON_BACKEND', None)
+    if path is None:
+        return json.dumps(value)
+
+    try:
+        dumps = _json_backends[path]
+    except KeyError:
+        dumps = _json_backends[path] = import_string(path)
+
+    return dumps(value)
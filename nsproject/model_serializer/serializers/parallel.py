@@ -0,0 +1,127 @@
+import os
+import asyncio
+import functools
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import connections, close_old_connections, DEFAULT_DB_ALIAS
+
+from model_serializer.instrumentation import propagate_metrics
+
+# 字段的取值方式，在 Serializer 中通过 io_bound_fields / cpu_bound_fields 声明
+IO_BOUND = "io"
+CPU_BOUND = "cpu"
+# async def 定义的 serialize_{field}()，使用 asyncio 并发执行
+ASYNC = "async"
+
+# I/O 密集字段使用的线程数
+DEFAULT_IO_WORKERS = 8
+# 实例数量达到该值时，CPU 密集字段才使用进程池，否则在当前线程中依次计算
+DEFAULT_CPU_BOUND_MIN_SIZE = 500
+
+# 线程池、进程池在第一次使用时创建，创建时持有 _executor_lock，避免同时到达的请求重复创建
+_io_executor = None
+_cpu_executor = None
+_cpu_workers = None
+_executor_lock = threading.Lock()
+
+
+def evaluate_many(method, bound, instances, **kwargs):
+    """
+    对 instances 逐个调用 method(instance, **kwargs)，返回与 instances 一一对应的值列表
+
+    * io: 在线程池中并发执行；实例所在的数据库连接处于事务中时依次执行，
+      因为线程使用各自的数据库连接，读取不到事务中未提交的数据
+    * cpu: 实例数量较多时在进程池中分块执行，method 及实例、返回值必须可以 pickle，且不能访问数据库
+    * async: method 为 async 函数，使用 asyncio 并发执行，在 ASGI 下运行于请求所在的事件循环
+
+    返回值的顺序与 instances 相同；所有调用结束后，若有异常，抛出顺序最靠前的实例的异常。
+    """
+    instances = list(instances)
+    if kwargs:
+        method = functools.partial(method, **kwargs)
+
+    if bound == ASYNC:
+        return async_to_sync(_gather)(method, instances)
+
+    if bound == CPU_BOUND:
+        min_size = getattr(settings, 'MODEL_SERIALIZER_CPU_BOUND_MIN_SIZE', DEFAULT_CPU_BOUND_MIN_SIZE)
+        if len(instances) < min_size:
+            return [method(instance) for instance in instances]
+        executor = _get_cpu_executor()
+        chunk_size = -(-len(instances) // (_cpu_workers * 4))
+        chunks = [instances[i:i + chunk_size] for i in range(0, len(instances), chunk_size)]
+        futures = [executor.submit(_call_chunk, method, chunk) for chunk in chunks]
+    elif len(instances) <= 1 or _in_atomic_block(instances[0]):
+        return [method(instance) for instance in instances]
+    else:
+        executor = _get_io_executor()
+        # 线程中的查询计入当前请求的统计及查询次数限制
+        futures = [executor.submit(propagate_metrics(_call_in_thread), method, instance) for instance in instances]
+
+    wait(futures)
+    values = []
+    for future in futures:
+        value = future.result()
+        if bound == CPU_BOUND:
+            values.extend(value)
+        else:
+            values.append(value)
+    return values
+
+
+async def _gather(method, instances):
+    results = await asyncio.gather(*[method(instance) for instance in instances], return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+def _in_atomic_block(instance):
+    return connections[instance._state.db or DEFAULT_DB_ALIAS].in_atomic_block
+
+
+def _call_in_thread(method, instance):
+    # 执行前后都按照 CONN_MAX_AGE 关闭过期的连接，避免复用已被数据库断开的连接
+    close_old_connections()
+    try:
+        return method(instance)
+    finally:
+        close_old_connections()
+
+
+def _call_chunk(method, instances):
+    return [method(instance) for instance in instances]
+
+
+def _get_io_executor():
+    global _io_executor
+    if _io_executor is None:
+        with _executor_lock:
+            if _io_executor is None:
+                _io_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'MODEL_SERIALIZER_IO_WORKERS', DEFAULT_IO_WORKERS),
+                    thread_name_prefix='model_serializer_io',
+                )
+    return _io_executor
+
+
+def _get_cpu_executor():
+    global _cpu_executor, _cpu_workers
+    if _cpu_executor is None:
+        with _executor_lock:
+            if _cpu_executor is None:
+                # _cpu_workers 先于 _cpu_executor 赋值，其他线程看到 _cpu_executor 时 _cpu_workers 已可用
+                _cpu_workers = getattr(settings, 'MODEL_SERIALIZER_CPU_WORKERS', None) or os.cpu_count() or 1
+                _cpu_executor = ProcessPoolExecutor(max_workers=_cpu_workers, initializer=_discard_connections)
+    return _cpu_executor
+
+
+def _discard_connections():
+    # 子进程继承了父进程的数据库连接，直接丢弃而不是关闭，避免影响父进程的连接
+    for alias in connections:
+        connections[alias].connection = None
@@ -0,0 +1,418 @@
+import functools
+import itertools
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import QuerySet, Model, Q, prefetch_related_objects
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.query import ModelIterable, ValuesListIterable
+from django.db.models.sql.constants import GET_ITERATOR_CHUNK_SIZE
+
+from model_serializer.serializers.model import make_model_serializer
+from model_serializer.serializers.converters import get_column_converter
+from model_serializer.serializers.raw_json import RawJSON, raw_json_alias, raw_json_annotations
+
+# 已计算好的关联查询，key 为 (ModelClass, plan.key)，value 为 (select_related, prefetch_related)
+_related_lookups = dict()
+# 已计算好的 only() 字段，key 为 (ModelClass, plan.key)，value 为字段元组，无法确定时为 None
+_only_fields = dict()
+# 已生成的 values 迭代器类，key 为 (ModelClass, plan.key)，value 为迭代器类，不适用时为 None
+_values_iterables = dict()
+
+
+class DeferredFieldError(Exception):
+    """
+    序列化时访问了被 only() 延迟加载的字段，这会导致每个实例额外查询一次数据库
+    """
+
+
+def optimize_queryset(queryset, *, fields=None, group=None, serializer=None, values=True):
+    """
+    根据序列化方案，自动为 queryset 加上 select_related / prefetch_related，
+    避免序列化关联字段时每个实例都查询一次数据库（N+1）；
+    同时使用 only() 只查询需要的字段，避免加载不需要输出的大字段。
+
+    DEBUG 模式下，若序列化时访问了未加载的字段，将抛出 DeferredFieldError。
+
+    若方案中只包含普通字段（没有关联字段、serialize_*() 方法、property），
+    将直接使用 values_list() 查询，返回的是已经序列化好的 dict，不再创建 Model 实例，
+    如果后续还需要读取 Model 实例（如游标分页），可以指定 values=False 关闭该行为。
+
+    Serializer.raw_json_fields 中的字段以文本形式查询，编码时原样输出，不再解析、重新编码。
+
+    :param queryset: QuerySet，其他类型的对象会原样返回。
+    :param fields: 需要序列化的字段。
+    :param group: 需要序列化的字段组。
+    :param serializer: 使用的 serializer 类名称，如 ListSerializer，默认为 Serializer。
+    :param values: 是否允许使用 values_list() 直接序列化。
+
+    union() 等组合查询不做任何处理；已经指定过 only() / defer() 的 queryset，不再自动加上关联查询。
+    """
+    if not isinstance(queryset, QuerySet) or queryset._iterable_class is not ModelIterable:
+        return queryset
+    # union()、intersection()、difference() 之后不支持 select_related / only 等操作
+    if queryset.query.combinator:
+        return queryset
+
+    ModelClass = queryset.model
+    if not hasattr(ModelClass, 'Serializer'):
+        return queryset
+
+    plan = make_model_serializer(ModelClass, name=serializer).get_plan(fields, group)
+
+    raw_json_fields = get_raw_json_fields(ModelClass, plan)
+    if raw_json_fields:
+        queryset = queryset.annotate(**raw_json_annotations(raw_json_fields))
+
+    values_iterable = get_values_iterable(ModelClass, plan) if values else None
+    if values_iterable is not None:
+        queryset = queryset.values_list(*values_iterable.columns)
+        queryset._iterable_class = values_iterable
+        return queryset
+
+    # 已经指定过 only() / defer() 的 queryset，以使用者的指定为准，
+    # 被延迟加载的关联字段不能再 select_related
+    if queryset.query.deferred_loading != (frozenset(), True):
+        return queryset
+
+    # 使用者自行指定的 select_related，其外键字段也需要查询
+    requested_related = queryset.query.select_related
+    select_related, prefetch_related = get_related_lookups(ModelClass, plan)
+
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+
+    only_fields = get_only_fields(ModelClass, plan)
+    if requested_related is True:
+        # select_related() 不带参数时无法确定会加载哪些关联对象，不限制查询的字段
+        only_fields = None
+    elif only_fields is not None and requested_related:
+        only_fields = only_fields + tuple(_get_select_related_fields(ModelClass, requested_related, ''))
+
+    if only_fields is not None:
+        # 以文本形式查询的 JSON 字段不需要再按原始字段查询，除非 serialize_*() 方法依赖该字段
+        dependencies = getattr(make_model_serializer(ModelClass, name=serializer), 'field_dependencies', {})
+        excluded = set(raw_json_fields).difference(*dependencies.values())
+        queryset = queryset.only(*[name for name in only_fields if name not in excluded])
+        if settings.DEBUG:
+            queryset._iterable_class = DeferredFieldGuardIterable
+    # 无法确定 serialize_*() 方法依赖哪些字段时，JSON 字段仍按原始字段查询，避免每个实例再查询一次
+
+    return queryset
+
+
+def iter_queryset_chunks(queryset, chunk_size):
+    """
+    按照 queryset 的排序分块读取数据，每次返回一块（list），内存占用只与 chunk_size 有关
+
+    MySQL 的 .iterator() 不是服务端游标，mysqlclient 会将整个结果集读入内存，因此使用 keyset 分块：
+    每块先查询排序字段及主键，WHERE (排序字段, 主键) > 上一块的最后一行 LIMIT chunk_size，
+    再按主键查询这一块的数据；prefetch_related 在每一块上分别执行。
+
+    未排序的 queryset 按主键排序。排序中包含可为 NULL 的字段、关联字段、表达式，
+    或者 queryset 已经切片、使用了 union()、GROUP BY 时无法使用 keyset 分块，
+    退化为 .iterator(chunk_size=...)，此时 MySQL 下内存占用与数据总量成正比。
+    """
+    ordering = _get_keyset_ordering(queryset)
+    if ordering is None:
+        yield from _iter_chunks(queryset, chunk_size)
+        return
+
+    order_by = [('-' if desc else '') + name for name, desc in ordering]
+    queryset = queryset.order_by(*order_by)
+    keys_queryset = queryset.prefetch_related(None).values_list(*[name for name, _ in ordering])
+
+    last = None
+    while True:
+        chunk_keys = keys_queryset if last is None else keys_queryset.filter(_keyset_filter(ordering, last))
+        keys = list(chunk_keys[:chunk_size])
+        if not keys:
+            return
+        # 排序字段的最后一个为主键
+        yield list(queryset.filter(pk__in=[key[-1] for key in keys]))
+        if len(keys) < chunk_size:
+            return
+        last = keys[-1]
+
+
+def _get_keyset_ordering(queryset):
+    # 返回 [(字段名, 是否倒序), ...]，最后一个为主键，无法使用 keyset 分块时返回 None
+    query = queryset.query
+    if query.is_sliced or query.combinator or query.group_by is not None or query.extra_order_by:
+        return None
+
+    opts = queryset.model._meta
+    ordering = []
+    for name in query.order_by or (opts.ordering if query.default_ordering else ()):
+        if not isinstance(name, str) or name == '?' or LOOKUP_SEP in name:
+            return None
+        desc = name.startswith('-')
+        name = name[1:] if desc else name
+        if name == 'pk':
+            name = opts.pk.name
+        try:
+            f = opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if not f.concrete or f.is_relation or f.null:
+            return None
+        ordering.append((name, desc))
+        if f.primary_key:
+            return ordering
+
+    ordering.append((opts.pk.name, ordering[-1][1] if ordering else False))
+    return ordering
+
+
+def _keyset_filter(ordering, values):
+    # (a, b) > (x, y) 的等价条件：a > x OR (a = x AND b > y)，倒序的字段使用 <
+    condition = Q()
+    equals = Q()
+    for (name, desc), value in zip(ordering, values):
+        condition |= equals & Q(**{f'{name}__{"lt" if desc else "gt"}': value})
+        equals &= Q(**{name: value})
+    return condition
+
+
+def _iter_chunks(queryset, chunk_size):
+    lookups = queryset._prefetch_related_lookups
+    if lookups:
+        # .iterator() 会忽略 prefetch_related，改为对每一块数据手动 prefetch
+        queryset = queryset.prefetch_related(None)
+    iterator = queryset.iterator(chunk_size=chunk_size)
+
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        if lookups and isinstance(chunk[0], Model):
+            prefetch_related_objects(chunk, *lookups)
+        yield chunk
+
+
+def get_related_lookups(ModelClass, plan):
+    """
+    计算序列化方案需要的关联查询，返回 (select_related, prefetch_related) 二元组
+
+    嵌套的关联对象由 JSONEncoder 按其默认字段序列化，因此会递归计算关联 Model 默认方案中的关联字段。
+    """
+    key = (ModelClass, plan.key)
+    try:
+        return _related_lookups[key]
+    except KeyError:
+        pass
+
+    select_related, prefetch_related = [], []
+    _collect_related_lookups(plan, '', False, {ModelClass}, select_related, prefetch_related)
+
+    lookups = tuple(select_related), tuple(prefetch_related)
+    _related_lookups[key] = lookups
+    return lookups
+
+
+def _collect_related_lookups(plan, prefix, many, seen, select_related, prefetch_related):
+    for field, f in plan.relations:
+        lookup = prefix + field
+        # 路径上一旦出现一对多、多对多，后续的关联都只能使用 prefetch_related
+        is_many = many or f.many_to_many or f.one_to_many
+        if is_many:
+            prefetch_related.append(lookup)
+        else:
+            select_related.append(lookup)
+
+        RelatedModel = f.related_model
+        if RelatedModel in seen or not hasattr(RelatedModel, 'Serializer'):
+            continue
+
+        related_plan = make_model_serializer(RelatedModel).get_plan()
+        _collect_related_lookups(
+            related_plan, f'{lookup}__', is_many, seen | {RelatedModel}, select_related, prefetch_related,
+        )
+
+
+def get_raw_json_fields(ModelClass, plan):
+    """
+    返回序列化方案中以文本形式查询的 JSON 字段
+    """
+    raw_json_fields = make_model_serializer(ModelClass, name=plan.serializer).raw_json_fields
+    if not raw_json_fields:
+        return ()
+    return tuple(field for field in plan.fields if field in raw_json_fields)
+
+
+def get_values_iterable(ModelClass, plan):
+    """
+    为只包含普通字段的序列化方案生成 values 迭代器类，其他方案返回 None
+    """
+    key = (ModelClass, plan.key)
+    try:
+        return _values_iterables[key]
+    except KeyError:
+        pass
+
+    if all(f is not None and f.concrete and not f.is_relation for f in plan.model_fields):
+        raw_json_fields = get_raw_json_fields(ModelClass, plan)
+        converters = tuple(
+            (index, _raw_json_column if f.name in raw_json_fields else get_column_converter(f))
+            for index, f in enumerate(plan.model_fields)
+        )
+        values_iterable = type(f'{ModelClass.__name__}ValuesIterable', (SerializedValuesIterable,), dict(
+            columns=tuple(raw_json_alias(f.name) if f.name in raw_json_fields else f.name for f in plan.model_fields),
+            keys=plan.keys,
+            converters=tuple((index, converter) for index, converter in converters if converter is not None),
+        ))
+    else:
+        values_iterable = None
+
+    _values_iterables[key] = values_iterable
+    return values_iterable
+
+
+def _raw_json_column(values):
+    return [None if text is None else RawJSON(text) for text in values]
+
+
+class SerializedValuesIterable(ValuesListIterable):
+    """
+    将 values_list() 查询出的每一行直接转换为序列化结果，需要转换的列按块批量转换
+    """
+    # 查询的字段
+    columns = ()
+    # 输出的 key，与 columns 一一对应
+    keys = ()
+    # ((index, column_converter), ...)，需要转换的列
+    converters = ()
+
+    def __iter__(self):
+        keys = self.keys
+        converters = self.converters
+        rows = super().__iter__()
+
+        if not converters:
+            for row in rows:
+                yield dict(zip(keys, row))
+            return
+
+        while True:
+            chunk = list(itertools.islice(rows, GET_ITERATOR_CHUNK_SIZE))
+            if not chunk:
+                return
+            columns = list(zip(*chunk))
+            for index, converter in converters:
+                columns[index] = converter(columns[index])
+            for row in zip(*columns):
+                yield dict(zip(keys, row))
+
+
+def get_only_fields(ModelClass, plan):
+    """
+    计算序列化方案需要查询的字段，用于 queryset.only()
+
+    包括主键、直接输出的字段、关联字段的外键，以及 Serializer.field_dependencies 中声明的字段。
+    通过 select_related 加载的关联对象也会计算其需要的字段。
+    若方案中包含未声明依赖的 serialize_*() 方法或 property，无法确定需要哪些字段，返回 None。
+    """
+    key = (ModelClass, plan.key)
+    try:
+        return _only_fields[key]
+    except KeyError:
+        pass
+
+    only_fields = _collect_only_fields(ModelClass, plan, '', {ModelClass})
+    if only_fields is not None:
+        only_fields = tuple(dict.fromkeys(only_fields))
+    _only_fields[key] = only_fields
+    return only_fields
+
+
+def _collect_only_fields(ModelClass, plan, prefix, seen):
+    dependencies = getattr(make_model_serializer(ModelClass, name=plan.serializer), 'field_dependencies', {})
+    only_fields = [prefix + ModelClass._meta.pk.name]
+    related = []
+
+    for field, f in zip(plan.fields, plan.model_fields):
+        if field in dependencies:
+            only_fields.extend(prefix + name for name in dependencies[field])
+        elif f is None:
+            return None
+        elif f.many_to_many or f.one_to_many:
+            # 通过 prefetch_related 加载，只需要主键
+            continue
+        elif f.is_relation and f.related_model is not None:
+            # ForeignKey、OneToOneField 需要外键字段，反向的 OneToOne 只需要主键
+            if f.concrete:
+                only_fields.append(prefix + f.name)
+            related.append((field, f.related_model))
+        elif f.concrete:
+            only_fields.append(prefix + f.name)
+        else:
+            return None
+
+    for field, RelatedModel in related:
+        # 通过 select_related 加载的关联对象，按照其默认方案计算需要的字段，
+        # 无法确定时不限制该关联对象的字段
+        if RelatedModel in seen or not hasattr(RelatedModel, 'Serializer'):
+            continue
+        related_plan = make_model_serializer(RelatedModel).get_plan()
+        related_fields = _collect_only_fields(RelatedModel, related_plan, f'{prefix}{field}__', seen | {RelatedModel})
+        if related_fields is not None:
+            only_fields.extend(related_fields)
+
+    return only_fields
+
+
+def _get_select_related_fields(ModelClass, requested, prefix):
+    # select_related 的结构为 {'task_topo': {...}}，返回路径上需要查询的字段：
+    # 末端的关联对象只需要外键，其字段全部查询；中间的关联对象一旦出现在 only() 中就只查询指定的字段，
+    # 因此需要列出其全部字段
+    names = []
+    for name, nested in requested.items():
+        try:
+            f = ModelClass._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        # 反向的 OneToOne 不需要查询外键字段
+        if not (f.concrete and f.is_relation):
+            continue
+        names.append(prefix + name)
+        if nested:
+            names.extend(f'{prefix}{name}__{related.name}' for related in f.related_model._meta.concrete_fields)
+            names.extend(_get_select_related_fields(f.related_model, nested, f'{prefix}{name}__'))
+    return names
+
+
+class DeferredFieldGuardIterable(ModelIterable):
+    """
+    为查询出的实例（包括 select_related 加载的关联对象）加上保护，
+    访问延迟加载的字段时抛出 DeferredFieldError，而不是静默地再查询一次数据库
+    """
+
+    def __iter__(self):
+        for instance in super().__iter__():
+            _guard_deferred_fields(instance, set())
+            yield instance
+
+
+def _guard_deferred_fields(instance, seen):
+    if id(instance) in seen:
+        return
+    seen.add(id(instance))
+
+    if instance.get_deferred_fields():
+        instance.refresh_from_db = functools.partial(_refresh_from_db, instance)
+
+    for related in instance._state.fields_cache.values():
+        if isinstance(related, Model):
+            _guard_deferred_fields(related, seen)
+
+
+def _refresh_from_db(instance, using=None, fields=None):
+    deferred_fields = instance.get_deferred_fields()
+    if fields is not None and deferred_fields.issuperset(fields):
+        raise DeferredFieldError(
+            f'{instance.__class__.__name__} 的字段 {", ".join(fields)} 未被查询，'
+            '请在 Serializer.field_dependencies 中声明序列化方法依赖的字段'
+        )
+    return type(instance).refresh_from_db(instance, using=using, fields=fields)
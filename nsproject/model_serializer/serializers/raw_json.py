@@ -0,0 +1,91 @@
+import re
+import json
+import uuid
+
+from django.db.models import TextField
+from django.db.models.functions import Cast
+
+
+class RawJSON:
+    """
+    从数据库中读取的、已经是合法 JSON 的文本，编码时原样拼接到输出中，不再 json.loads / json.dumps
+    """
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+    def __repr__(self):
+        return f'RawJSON({self.text!r})'
+
+    def load(self):
+        return json.loads(self.text)
+
+
+class RawJSONCollector:
+    """
+    编码时先将 RawJSON 替换为占位字符串，编码完成后再将占位字符串替换为原始的 JSON 文本
+
+    占位字符串中包含随机值，不会与数据中的字符串冲突。
+    """
+
+    def __init__(self):
+        self.prefix = f'__raw_json_{uuid.uuid4().hex}_'
+        self.values = []
+        self._pattern = re.compile('"' + re.escape(self.prefix) + r'(\d+)"')
+        self._bytes_pattern = re.compile(self._pattern.pattern.encode())
+
+    def placeholder(self, raw):
+        self.values.append(raw.text)
+        return f'{self.prefix}{len(self.values) - 1}'
+
+    def splice(self, content):
+        """
+        将 content（str 或 bytes）中的占位字符串替换为原始的 JSON 文本
+        """
+        if not self.values:
+            return content
+
+        values = self.values
+        self.values = []
+        if isinstance(content, bytes):
+            return self._bytes_pattern.sub(lambda m: values[int(m.group(1))].encode(), content)
+        return self._pattern.sub(lambda m: values[int(m.group(1))], content)
+
+
+RAW_JSON_ALIAS_PREFIX = '_raw_json_'
+
+
+def raw_json_alias(field_name):
+    """
+    以文本形式查询 JSON 字段时使用的别名
+    """
+    return f'{RAW_JSON_ALIAS_PREFIX}{field_name}'
+
+
+def raw_json_annotations(field_names):
+    """
+    以文本形式查询 JSON 字段的 annotate 参数
+    """
+    return {raw_json_alias(name): Cast(name, output_field=TextField()) for name in field_names}
+
+
+def without_raw_json(queryset):
+    """
+    返回去掉了以文本形式查询 JSON 字段的 annotate 的 queryset，用于 COUNT 等聚合查询
+
+    带有 annotate 的 queryset 执行 COUNT 时，Django 会将原查询作为子查询，
+    JSON 字段的类型转换也会随之执行。
+    """
+    names = [name for name in queryset.query.annotations if name.startswith(RAW_JSON_ALIAS_PREFIX)]
+    if not names:
+        return queryset
+
+    queryset = queryset._chain()
+    query = queryset.query
+    for name in names:
+        del query.annotations[name]
+    if query.annotation_select_mask is not None:
+        query.set_annotation_mask(query.annotation_select_mask.difference(names))
+    query._annotation_select_cache = None
+    return queryset
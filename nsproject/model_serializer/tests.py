@@ -1,3 +1,918 @@
-from django.test import TestCase
+import json
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, RequestFactory, override_settings
+
+from model_serializer.models import Tasks, TasksTopo, Reports
+from model_serializer.response import api
+
+
+class ApiTestMixin:
+
+    @classmethod
+    def create_data(cls):
+        for i in range(5):
+            topo = TasksTopo.objects.create(bk_biz_id=i, bk_obj_id='set', bk_inst_id=i, bk_inst_name='n', path='/a')
+            task = Tasks.objects.create(task_topo=topo, task_name=i, test_list=[i, {'a': i}], test_char='x' * i)
+            for j in range(2):
+                Reports.objects.create(task_id=task, task_name='r', task_type='t', name=f'r{j}')
+
+    def setUp(self):
+        self.rf = RequestFactory()
+
+    def get_json(self, response):
+        content = b''.join(response) if response.streaming else response.content
+        return json.loads(content)
+
+
+class ApiTestCase(ApiTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_data()
+
+
+
+class DatetimeConverterTests(SimpleTestCase):
+    """
+    serialize_datetime / serialize_datetimes 的时区偏移量缓存与 make_naive + strftime 结果相同
+    """
+    zones = ['Asia/Shanghai', 'America/New_York', 'Europe/London', 'Asia/Kolkata', 'Asia/Kathmandu',
+             'Australia/Adelaide', 'Australia/Lord_Howe', 'Pacific/Chatham']
+
+    def get_values(self, zone):
+        import datetime
+        import pytz
+
+        tz = pytz.timezone(zone)
+        start = datetime.datetime(2021, 1, 1, 0, 0, 13, 999999, tzinfo=pytz.utc)
+        days = [start + datetime.timedelta(days=i) for i in range(366)]
+        values = [day + datetime.timedelta(hours=i * 5, minutes=i * 7) for i, day in enumerate(days)]
+        # 时区切换当天的每 5 分钟
+        for before, after in zip(days, days[1:]):
+            if before.astimezone(tz).utcoffset() != after.astimezone(tz).utcoffset():
+                values.extend(before + datetime.timedelta(minutes=i) for i in range(0, 24 * 60, 5))
+        # 非 UTC 的 aware datetime
+        values.extend(t.astimezone(tz) for t in values[::5])
+        return values
+
+    def test_timezones(self):
+        from django.utils import timezone
+        from model_serializer.serializers import converters
+
+        for zone in self.zones:
+            values = self.get_values(zone)
+            with timezone.override(zone), self.subTest(zone=zone):
+                expected = [timezone.make_naive(t).strftime(converters.DATETIME_FORMAT) for t in values]
+                # 正序、倒序分别从空的缓存开始，缓存的偏移量不能依赖于先转换的是哪个时间
+                for ordered in (values, values[::-1]):
+                    converters._offsets.clear()
+                    self.assertEqual([converters.serialize_datetime(t) for t in ordered],
+                                     expected if ordered is values else expected[::-1])
+                    converters._offsets.clear()
+                    self.assertEqual(converters.serialize_datetimes(ordered),
+                                     expected if ordered is values else expected[::-1])
+
+    def test_formats(self):
+        import datetime
+        import pytz
+        from django.utils import timezone
+        from model_serializer.serializers.converters import serialize_datetime, serialize_datetimes
+
+        t = pytz.utc.localize(datetime.datetime(2021, 3, 14, 7, 30, 5, 123456))
+        with timezone.override('America/New_York'):
+            self.assertEqual(serialize_datetime(t), '2021-03-14 03:30:05')
+            self.assertEqual(serialize_datetimes([t, None], '%Y/%m/%d %H:%M'), ['2021/03/14 03:30', None])
+        self.assertEqual(serialize_datetime(datetime.date(2021, 3, 14)), '2021-03-14')
+        self.assertEqual(serialize_datetime(datetime.time(1, 2, 3, 4)), '01:02:03')
+        self.assertEqual(serialize_datetimes([datetime.datetime(2021, 3, 14, 1, 2, 3, 4)]), ['2021-03-14 01:02:03'])
+
+class OptimizeQuerysetTests(ApiTestCase):
+
+    def test_page_list_group(self):
+        with self.assertNumQueries(3):
+            data = self.get_json(api.page(self.rf.get('/?page_size=3'), Tasks.objects.order_by('id'), group='list'))
+        self.assertEqual(len(data['data']), 3)
+        self.assertEqual(data['data'][0]['task_topo']['bk_inst_id'], 0)
+        self.assertEqual(len(data['data'][0]['report']), 2)
+
+    def test_union_queryset(self):
+        qs = Tasks.objects.filter(pk=1).union(Tasks.objects.filter(pk=2))
+        self.assertEqual(len(self.get_json(api.ok(qs, group='list'))['data']), 2)
+        qs = Tasks.objects.filter(pk=1).union(Tasks.objects.filter(pk=2)).order_by('id')
+        self.assertEqual(len(self.get_json(api.page(self.rf.get('/'), qs, group='list'))['data']), 2)
+
+    def test_deferred_relation(self):
+        data = self.get_json(api.ok(Tasks.objects.defer('task_topo').order_by('id'), group='list'))
+        self.assertEqual(data['data'][0]['task_topo']['bk_inst_id'], 0)
+
+    def test_caller_select_related(self):
+        for debug in (False, True):
+            with override_settings(DEBUG=debug), self.assertNumQueries(1):
+                qs = Tasks.objects.select_related('task_topo').order_by('id')
+                data = self.get_json(api.ok(qs, fields=['app']))
+            self.assertEqual(data['data'][0]['app'], 'xxxx')
+
+    def test_only_fields_with_caller_select_related(self):
+        from model_serializer.serializers import optimize_queryset
+
+        qs = optimize_queryset(Reports.objects.select_related('task_id__task_topo').order_by('id'), values=False)
+        with self.assertNumQueries(1):
+            report = qs[0]
+            self.assertEqual(report.task_id.task_topo.path, '/a')
+            self.assertEqual(report.task_id.test_char, '')
+
+    def test_values_path(self):
+        from model_serializer.serializers import optimize_queryset, model
+        from model_serializer.serializers.queryset import SerializedValuesIterable
+
+        Tasks.ValuesSerializer = type('ValuesSerializer', (), dict(
+            default_fields=['task_name', 'test_list'], raw_json_fields=['test_list'],
+        ))
+        self.addCleanup(delattr, Tasks, 'ValuesSerializer')
+        self.addCleanup(model._compiled_serializers.pop, (Tasks, 'ValuesSerializer'), None)
+
+        for queryset, kwargs in ((Reports.objects.order_by('id'), {}),
+                                 (TasksTopo.objects.order_by('id'), {}),
+                                 (Tasks.objects.order_by('id'), dict(serializer='ValuesSerializer'))):
+            with self.subTest(model=queryset.model.__name__):
+                optimized = optimize_queryset(queryset, **kwargs)
+                self.assertTrue(issubclass(optimized._iterable_class, SerializedValuesIterable))
+                # 列表中的 Model 实例不经过 values_list()，按实例序列化
+                expected = self.get_json(api.ok(list(queryset), **kwargs))['data']
+                self.assertEqual(self.get_json(api.ok(queryset, **kwargs))['data'], expected)
+                self.assertEqual(self.get_json(api.ok(queryset, native=True, **kwargs))['data'], expected)
+        self.assertIn('created_at', expected[0])
+        self.assertEqual(expected[1]['test_list'], [1, {'a': 1}])
+
+
+class SerializerRegistryTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        from model_serializer.serializers import model
+
+        Tasks.ListSerializer = type('ListSerializer', (), dict(default_fields=['task_name'], INCLUDE_TIMESTAMP=False))
+        self.addCleanup(delattr, Tasks, 'ListSerializer')
+        self.addCleanup(model._compiled_serializers.pop, (Tasks, 'ListSerializer'), None)
+
+    def test_declarations_unchanged(self):
+        from model_serializer.serializers.model import make_model_serializer
+
+        serializer = make_model_serializer(Tasks)
+        self.assertIn('id', serializer.default_fields)
+        self.assertEqual(Tasks.Serializer.default_fields, ['task_name', 'test_list', 'test_char'])
+        self.assertEqual(Tasks.Serializer.field_groups['list'],
+                         ['task_topo', 'task_name', 'test_list', 'test_char', 'app', 'report'])
+        make_model_serializer(Tasks, name='ListSerializer')
+        self.assertEqual(Tasks.ListSerializer.default_fields, ['task_name'])
+
+    def test_compiled_once(self):
+        import time
+        import threading
+        from unittest import mock
+        from model_serializer.serializers import model
+
+        compile_calls = []
+        compile_serializer = model._compile_model_serializer
+
+        def slow_compile(*args):
+            compile_calls.append(args)
+            time.sleep(0.05)
+            return compile_serializer(*args)
+
+        serializers = []
+        with mock.patch.object(model, '_compile_model_serializer', slow_compile):
+            threads = [
+                threading.Thread(target=lambda: serializers.append(
+                    model.make_model_serializer(Tasks, name='ListSerializer')))
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(compile_calls), 1)
+        self.assertEqual(len(set(map(id, serializers))), 1)
+
+    def test_named_serializer(self):
+        from model_serializer.serializers.model import make_model_serializer
+
+        plan = make_model_serializer(Tasks, name='ListSerializer').get_plan()
+        self.assertEqual(plan.serializer, 'ListSerializer')
+        self.assertNotEqual(plan.key, make_model_serializer(Tasks).get_plan(['task_name']).key)
+
+        data = self.get_json(api.ok(Tasks.objects.order_by('id'), serializer='ListSerializer'))
+        self.assertEqual(data['data'][:2], [{'task_name': 0, 'id': 1}, {'task_name': 1, 'id': 2}])
+        data = self.get_json(api.ok(Tasks.objects.order_by('id')))
+        self.assertIn('test_list', data['data'][0])
+
+        with self.assertRaises(ValueError):
+            make_model_serializer(Tasks, name='MissingSerializer')
+
+
+class CompactFormatTests(ApiTestCase):
+
+    def test_rows(self):
+        data = self.get_json(api.page(self.rf.get('/?format=rows&page_size=2'), Tasks.objects.order_by('id')))
+        self.assertEqual(data['data']['fields'][:3], ['task_name', 'test_list', 'test_char'])
+        self.assertEqual(data['data']['rows'][1][:3], [1, [1, {'a': 1}], 'x'])
+
+    def test_columns(self):
+        data = self.get_json(api.ok(Tasks.objects.order_by('id'), fields=['app'], format='columns'))
+        self.assertEqual(data['data']['columns'][data['data']['fields'].index('app')], ['xxxx'] * 5)
+
+    def test_values_queryset(self):
+        qs = Tasks.objects.values('id', 'task_name').order_by('id')
+        data = self.get_json(api.page(self.rf.get('/?format=rows'), qs))
+        self.assertEqual(data['data'], {'fields': ['id', 'task_name'], 'rows': [[i + 1, i] for i in range(5)]})
+
+    def test_requested_format_ignored(self):
+        data = self.get_json(api.page(self.rf.get('/?format=rows'), [1, 2, 3]))
+        self.assertEqual(data['data'], [1, 2, 3])
+
+    def test_explicit_format_error(self):
+        with self.assertRaises(ValueError):
+            api.ok([1, 2, 3], format='rows')
+
+
+class CachedCountTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+
+        cache.clear()
+
+    def test_cached_count_invalidation(self):
+        from model_serializer.response.count import get_cached_count
+
+        qs = Reports.objects.filter(task_name='r')
+        self.assertEqual(get_cached_count(qs), 10)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cached_count(qs), 10)
+        Reports.objects.filter(pk=1).delete()
+        self.assertEqual(get_cached_count(qs), 9)
+
+    def test_evicted_version(self):
+        from unittest import mock
+        from django.core.cache import cache
+        from django.db.models.signals import post_save
+        from model_serializer.response import count
+
+        qs = Reports.objects.filter(task_name='r')
+        self.assertEqual(count.get_cached_count(qs), 10)
+        # 版本号被淘汰后，不能再读取到淘汰前缓存的总数
+        cache.delete(count._model_version_key(Reports))
+        Reports.objects.filter(pk=1).delete()
+        self.assertEqual(count.get_cached_count(qs), 9)
+
+        with mock.patch.object(post_save, 'connect') as connect:
+            count.get_cached_count(qs)
+        connect.assert_not_called()
+
+
+
+class FetchPageTests(ApiTestCase):
+
+    def fetch_page(self, number, per_page=2, queryset=None, **kwargs):
+        from model_serializer.response.count import CountPaginator
+
+        paginator = CountPaginator(queryset if queryset is not None else Tasks.objects.order_by('id'), per_page)
+        page = paginator.fetch_page(number, **kwargs)
+        return [task.task_name for task in page], page.number, paginator.count
+
+    def test_short_first_page(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.fetch_page(1, per_page=10), ([0, 1, 2, 3, 4], 1, 5))
+
+    def test_short_last_page(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.fetch_page(3), ([4], 3, 5))
+
+    def test_full_page(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(self.fetch_page(2), ([2, 3], 2, 5))
+
+    def test_empty_first_page(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.fetch_page(1, queryset=Tasks.objects.filter(pk=0).order_by('id')), ([], 1, 0))
+
+    def test_out_of_range(self):
+        # 当前页为空时退化为 get_page()，返回最后一页
+        with self.assertNumQueries(3):
+            self.assertEqual(self.fetch_page(4), ([4], 3, 5))
+        self.assertEqual(self.fetch_page('x'), ([0, 1], 1, 5))
+
+    def test_concurrent_in_atomic_block(self):
+        # 事务中不并发查询，不满一页时同样不执行 COUNT
+        with self.assertNumQueries(1):
+            self.assertEqual(self.fetch_page(1, per_page=10, concurrent=True), ([0, 1, 2, 3, 4], 1, 5))
+
+
+class ConcurrentCountTests(ApiTestMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.create_data()
+
+    def test_concurrent(self):
+        import threading
+        from unittest import mock
+        from model_serializer.response.count import CountPaginator
+
+        threads = []
+        count = CountPaginator.count.func
+
+        def record_count(paginator):
+            threads.append(threading.current_thread().name)
+            paginator.__dict__['count'] = count(paginator)
+            return paginator.__dict__['count']
+
+        with mock.patch.object(CountPaginator, 'count', property(record_count)):
+            paginator = CountPaginator(Tasks.objects.order_by('id'), 2)
+            with self.assertNumQueries(1):
+                page = paginator.fetch_page(2, concurrent=True)
+        self.assertEqual([task.task_name for task in page], [2, 3])
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith('model_serializer_count'))
+        with self.assertNumQueries(0):
+            self.assertEqual(paginator.count, 5)
+
+class RowCacheTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+        from model_serializer.serializers.cache import watch_row_cache
+
+        cache.clear()
+        Reports.Serializer.CACHE = {'ttl': 60}
+        self.addCleanup(delattr, Reports.Serializer, 'CACHE')
+        watch_row_cache(Reports)
+
+    def test_fast_delete(self):
+        from django.db.models.deletion import Collector
+
+        self.assertTrue(Collector(using='default').can_fast_delete(TasksTopo.objects.all()))
+        self.assertFalse(Collector(using='default').can_fast_delete(Reports.objects.all()))
+
+    def test_invalidate_on_save(self):
+        def get_names():
+            reports = list(Reports.objects.only('id', 'task_name', 'name', 'task_type').order_by('id')[:2])
+            return [row['name'] for row in self.get_json(api.ok(reports, native=True))['data']]
+
+        self.assertEqual(get_names(), ['r0', 'r1'])
+        # update() 不发送信号，读取的是缓存
+        Reports.objects.filter(pk=1).update(name='updated')
+        self.assertEqual(get_names(), ['r0', 'r1'])
+
+        report = Reports.objects.get(pk=2)
+        report.name = 'changed'
+        report.save()
+        self.assertEqual(get_names(), ['r0', 'changed'])
+
+
+    def test_named_serializer(self):
+        Reports.CachedSerializer = type('CachedSerializer', (), dict(default_fields=['name'], CACHE={'ttl': 60}))
+        self.addCleanup(delattr, Reports, 'CachedSerializer')
+        del Reports.Serializer.CACHE
+        self.addCleanup(setattr, Reports.Serializer, 'CACHE', {'ttl': 60})
+
+        def get_names(**kwargs):
+            reports = list(Reports.objects.order_by('id')[:2])
+            return [row['name'] for row in self.get_json(api.ok(reports, **kwargs))['data']]
+
+        self.assertEqual(get_names(serializer='CachedSerializer'), ['r0', 'r1'])
+        self.assertEqual(get_names(serializer='CachedSerializer', native=True), ['r0', 'r1'])
+        Reports.objects.filter(pk=1).update(name='updated')
+        # 只有声明了 CACHE 的 serializer 使用行缓存
+        self.assertEqual(get_names(serializer='CachedSerializer'), ['r0', 'r1'])
+        self.assertEqual(get_names(serializer='CachedSerializer', native=True), ['r0', 'r1'])
+        self.assertEqual(get_names(), ['updated', 'r1'])
+
+        report = Reports.objects.get(pk=1)
+        report.save()
+        self.assertEqual(get_names(serializer='CachedSerializer'), ['updated', 'r1'])
+
+def serialize_first(self):
+    return self.test_list[0]
+
+
+class RawJSONTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Tasks.serialize_first = serialize_first
+        Tasks.RawJSONSerializer = type('RawJSONSerializer', (), dict(
+            default_fields=['task_name', 'test_list', 'first'], raw_json_fields=['test_list'],
+        ))
+        self.addCleanup(delattr, Tasks, 'serialize_first')
+        self.addCleanup(delattr, Tasks, 'RawJSONSerializer')
+
+    def test_raw_json(self):
+        with self.assertNumQueries(1):
+            data = self.get_json(api.ok(Tasks.objects.order_by('id'), fields=['app']))
+        self.assertEqual(data['data'][1]['test_list'], [1, {'a': 1}])
+
+    def test_method_without_dependencies(self):
+        # 页面不满一页时不需要 COUNT，只有一次查询
+        with self.assertNumQueries(1):
+            response = api.page(self.rf.get('/'), Tasks.objects.order_by('id'), serializer='RawJSONSerializer')
+            data = self.get_json(response)
+        self.assertEqual([row['first'] for row in data['data']], [0, 1, 2, 3, 4])
+        self.assertEqual(data['data'][1]['test_list'], [1, {'a': 1}])
+
+    def test_count_without_cast(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        # 包含 serialize_*() 方法的方案使用 Model 实例，只包含字段的方案使用 values_list()
+        for fields, count in ((None, 'exact'), (None, 'cached'), (['task_name', 'test_list'], 'exact')):
+            with CaptureQueriesContext(connection) as queries:
+                response = api.page(self.rf.get('/?page_size=2'), Tasks.objects.order_by('id'), fields=fields,
+                                    serializer='RawJSONSerializer', count=count, count_timeout=0)
+                self.assertEqual(self.get_json(response)['pagination']['total'], 5)
+            count_sql, = [query['sql'] for query in queries if 'COUNT' in query['sql']]
+            self.assertNotIn('CAST', count_sql.upper())
+            self.assertNotIn('_raw_json_', count_sql)
+
+
+
+def serialize_extra(self):
+    import uuid
+    import decimal
+    import datetime
+    from django.utils import timezone
+
+    created_at = timezone.make_aware(datetime.datetime(2021, 3, 14, 1, 2, 3, 456))
+    return {
+        'price': decimal.Decimal('1.10'),
+        'uid': uuid.UUID(int=self.pk),
+        'at': [created_at, created_at.date(), created_at.time()],
+        'nested': {'values': (decimal.Decimal(self.pk), None, 'x')},
+    }
+
+
+class NativeEncoderTests(ApiTestCase):
+    """
+    native=True 与 JSONEncoder 的输出相同
+    """
+
+    def setUp(self):
+        super().setUp()
+        from model_serializer.serializers import model
+
+        Tasks.serialize_extra = serialize_extra
+        Tasks.NativeSerializer = type('NativeSerializer', (), dict(
+            default_fields=['task_topo', 'task_name', 'test_list', 'report', 'extra'], raw_json_fields=['test_list'],
+        ))
+        self.addCleanup(delattr, Tasks, 'serialize_extra')
+        self.addCleanup(delattr, Tasks, 'NativeSerializer')
+        self.addCleanup(model._compiled_serializers.pop, (Tasks, 'NativeSerializer'), None)
+
+    def assert_same_output(self, build):
+        content = build(native=False).content
+        self.assertEqual(build(native=True).content, content)
+        return json.loads(content)['data']
+
+    def test_nested_relations(self):
+        data = self.assert_same_output(lambda native: api.ok(Tasks.objects.order_by('id'), group='list', native=native))
+        self.assertEqual(data[0]['task_topo']['bk_inst_id'], 0)
+        self.assertEqual(len(data[0]['report']), 2)
+
+    def test_value_types(self):
+        data = self.assert_same_output(
+            lambda native: api.ok(Tasks.objects.order_by('id'), serializer='NativeSerializer', native=native))
+        self.assertEqual(data[1]['extra'], {
+            'price': '1.10', 'uid': '00000000-0000-0000-0000-000000000002',
+            'at': ['2021-03-14 01:02:03', '2021-03-14', '01:02:03'], 'nested': {'values': ['2', None, 'x']},
+        })
+        self.assertEqual(data[1]['test_list'], [1, {'a': 1}])
+        self.assertEqual(data[1]['report'][0]['name'], 'r0')
+
+    def test_page_and_instance(self):
+        self.assert_same_output(lambda native: api.page(
+            self.rf.get('/?page_size=2&page=2'), Tasks.objects.order_by('id'), serializer='NativeSerializer',
+            native=native,
+        ))
+        self.assert_same_output(
+            lambda native: api.ok(Tasks.objects.get(pk=3), serializer='NativeSerializer', native=native))
+
+
+class BatchFieldTests(ApiTestCase):
+    """
+    serialize_many_{field}() 对一页数据只调用一次
+    """
+
+    def setUp(self):
+        super().setUp()
+        from model_serializer.serializers import model
+
+        self.calls = []
+        self.truncate = False
+
+        def serialize_many_score(cls, instances, factor=1):
+            self.calls.append(([instance.pk for instance in instances], factor))
+            values = [instance.task_name * factor for instance in instances]
+            return values[:-1] if self.truncate else values
+
+        Tasks.serialize_many_score = classmethod(serialize_many_score)
+        Tasks.BatchSerializer = type('BatchSerializer', (), dict(
+            default_fields=['task_name', 'score'], INCLUDE_PRIMARY_KEY=False, INCLUDE_TIMESTAMP=False,
+        ))
+        self.addCleanup(delattr, Tasks, 'serialize_many_score')
+        self.addCleanup(delattr, Tasks, 'BatchSerializer')
+        self.addCleanup(model._compiled_serializers.pop, (Tasks, 'BatchSerializer'), None)
+
+    def test_once_per_page(self):
+        for native in (False, True):
+            self.calls.clear()
+            response = api.page(self.rf.get('/?page_size=2&page=2'), Tasks.objects.order_by('id'),
+                                serializer='BatchSerializer', native=native, factor=10)
+            self.assertEqual(self.get_json(response)['data'],
+                             [{'task_name': 2, 'score': 20}, {'task_name': 3, 'score': 30}])
+            self.assertEqual(self.calls, [([3, 4], 10)])
+
+    def test_single_instance(self):
+        data = self.get_json(api.ok(Tasks.objects.get(pk=2), serializer='BatchSerializer'))['data']
+        self.assertEqual(data, {'task_name': 1, 'score': 1})
+        self.assertEqual(self.calls, [([2], 1)])
+
+    def test_length_mismatch(self):
+        self.truncate = True
+        with self.assertRaisesMessage(ValueError, 'serialize_many_score()'):
+            api.ok(Tasks.objects.order_by('id'), serializer='BatchSerializer')
+
+class ConditionalTests(ApiTestCase):
+
+    def test_etag(self):
+        response = api.page(self.rf.get('/'), Tasks.objects.order_by('id'), conditional=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+
+        request = self.rf.get('/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(api.page(request, Tasks.objects.order_by('id'), conditional=True).status_code, 304)
+
+        Tasks.objects.filter(pk=5).delete()
+        self.assertEqual(api.page(request, Tasks.objects.order_by('id'), conditional=True).status_code, 200)
+
+    def test_different_filters(self):
+        Tasks.objects.update(updated_at=Tasks.objects.get(pk=3).updated_at)
+        first = api.ok(Tasks.objects.filter(pk__in=[1, 3]).order_by('id'), cache_timeout=60,
+                       conditional_request=self.rf.get('/'))
+        second = api.ok(Tasks.objects.filter(pk__in=[2, 3]).order_by('id'), cache_timeout=60,
+                        conditional_request=self.rf.get('/'))
+        self.assertNotEqual(first['ETag'], second['ETag'])
+        self.assertEqual([row['id'] for row in self.get_json(second)['data']], [2, 3])
+
+    def test_if_modified_since_after_delete(self):
+        from django.utils.http import http_date
+
+        Tasks.objects.filter(pk=5).delete()
+        request = self.rf.get('/', HTTP_IF_MODIFIED_SINCE=http_date(2 ** 31))
+        self.assertEqual(api.page(request, Tasks.objects.order_by('id'), conditional=True).status_code, 200)
+
+    def test_instance_last_modified(self):
+        response = api.ok(Tasks.objects.get(pk=1), conditional_request=self.rf.get('/'))
+        request = self.rf.get('/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(api.ok(Tasks.objects.get(pk=1), conditional_request=request).status_code, 304)
+
+
+def serialize_topo_name(self):
+    import threading
+
+    return threading.current_thread().name, TasksTopo.objects.get(pk=self.task_topo_id).bk_inst_name
+
+
+def serialize_checked(self):
+    if self.task_name in (2, 3):
+        raise ValueError(f'task {self.task_name}')
+    return self.task_name
+
+
+async def serialize_doubled(self):
+    return self.task_name * 2
+
+
+def serialize_pid(self):
+    import os
+
+    return os.getpid(), self.task_name
+
+
+class ParallelFieldMixin:
+
+    def setUp(self):
+        super().setUp()
+        Tasks.serialize_topo_name = serialize_topo_name
+        Tasks.serialize_checked = serialize_checked
+        Tasks.serialize_doubled = serialize_doubled
+        Tasks.serialize_pid = serialize_pid
+        Tasks.ParallelSerializer = type('ParallelSerializer', (), dict(
+            default_fields=['task_name', 'topo_name', 'doubled'], optional_fields=['checked', 'pid'],
+            io_bound_fields=['topo_name', 'checked'], cpu_bound_fields=['pid'], INCLUDE_TIMESTAMP=False,
+        ))
+        for name in ('serialize_topo_name', 'serialize_checked', 'serialize_doubled', 'serialize_pid',
+                     'ParallelSerializer'):
+            self.addCleanup(delattr, Tasks, name)
+
+    def serialize(self, **kwargs):
+        data = self.get_json(api.ok(Tasks.objects.order_by('id'), serializer='ParallelSerializer', **kwargs))
+        return data['data']
+
+
+class ParallelFieldTests(ParallelFieldMixin, ApiTestCase):
+
+    def test_atomic_block(self):
+        # TestCase 在事务中执行，io_bound 字段依次计算，能读取到未提交的数据
+        TasksTopo.objects.filter(pk=1).update(bk_inst_name='uncommitted')
+        rows = self.serialize()
+        self.assertEqual([row['topo_name'][1] for row in rows], ['uncommitted', 'n', 'n', 'n', 'n'])
+        self.assertEqual([row['doubled'] for row in rows], [0, 2, 4, 6, 8])
+
+    def test_error_order(self):
+        with self.assertRaisesMessage(ValueError, 'task 2'):
+            self.serialize(fields=['checked'])
+
+    def test_process_pool(self):
+        import os
+
+        with override_settings(MODEL_SERIALIZER_CPU_BOUND_MIN_SIZE=2):
+            rows = self.serialize(fields=['pid'])
+        self.assertEqual([row['pid'][1] for row in rows], [0, 1, 2, 3, 4])
+        self.assertNotIn(os.getpid(), {row['pid'][0] for row in rows})
+
+        # 数量不足时在当前进程中计算
+        rows = self.serialize(fields=['pid'])
+        self.assertEqual({row['pid'][0] for row in rows}, {os.getpid()})
+
+
+class ParallelFieldThreadTests(ParallelFieldMixin, ApiTestMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.create_data()
+
+    def test_thread_pool(self):
+        rows = self.serialize()
+        self.assertEqual([row['task_name'] for row in rows], [0, 1, 2, 3, 4])
+        self.assertEqual({row['topo_name'][1] for row in rows}, {'n'})
+        self.assertTrue(all(row['topo_name'][0].startswith('model_serializer_io') for row in rows))
+
+    def test_error_order(self):
+        with self.assertRaisesMessage(ValueError, 'task 2'):
+            self.serialize(fields=['checked'])
+
+
+
+class ThreadMetricsTests(ParallelFieldMixin, ApiTestMixin, TransactionTestCase):
+    """
+    线程池中执行的查询计入当前的统计及查询次数限制
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.create_data()
+
+    def test_io_bound_fields(self):
+        from model_serializer.instrumentation import instrument, QueryBudgetExceeded
+
+        with instrument() as metrics:
+            self.serialize()
+        self.assertEqual(metrics.queries, 6)
+        with self.assertRaises(QueryBudgetExceeded):
+            self.serialize(query_budget=5)
+
+    def test_concurrent_count(self):
+        from model_serializer.instrumentation import instrument, QueryBudgetExceeded
+
+        def page(**kwargs):
+            return api.page(self.rf.get('/?page_size=2'), Tasks.objects.order_by('id'), concurrent_count=True, **kwargs)
+
+        with instrument() as metrics:
+            page()
+        self.assertEqual(metrics.queries, 2)
+        with self.assertRaises(QueryBudgetExceeded):
+            page(query_budget=1)
+
+    def test_async_view(self):
+        from asgiref.sync import async_to_sync
+        from model_serializer.instrumentation import instrument
+
+        with instrument() as metrics:
+            async_to_sync(api.aok)(Tasks.objects.order_by('id'))
+        self.assertEqual(metrics.queries, 1)
+
+class CursorPaginationTests(ApiTestCase):
+
+    def get_page(self, cursor=None):
+        query = f'/?page_size=2&cursor={cursor}' if cursor else '/?page_size=2'
+        response = api.page(self.rf.get(query), Tasks.objects.all(), mode='cursor', ordering=('-created_at', '-id'))
+        return self.get_json(response)
+
+    def test_next_and_prev(self):
+        first = self.get_page()
+        self.assertEqual([row['id'] for row in first['data']], [5, 4])
+        self.assertIsNone(first['pagination']['prev'])
+
+        second = self.get_page(first['pagination']['next'])
+        self.assertEqual([row['id'] for row in second['data']], [3, 2])
+
+        third = self.get_page(second['pagination']['next'])
+        self.assertEqual([row['id'] for row in third['data']], [1])
+        self.assertIsNone(third['pagination']['next'])
+
+        self.assertEqual([row['id'] for row in self.get_page(third['pagination']['prev'])['data']], [3, 2])
+
+    def test_invalid_cursor(self):
+        import base64
+
+        for content in (b'not json', b'["next", [1]]', b'["next", ["zzz", 1]]', b'["next", [null, "x"]]'):
+            cursor = base64.urlsafe_b64encode(content).decode()
+            self.assertEqual([row['id'] for row in self.get_page(cursor)['data']], [5, 4])
+
+
+
+class ExportTests(ApiTestCase):
+
+    def export(self, queryset, **kwargs):
+        response = api.export(self.rf.get('/'), queryset, chunk_size=2, **kwargs)
+        return [json.loads(line) for line in b''.join(response).splitlines()]
+
+    def test_keyset_chunks(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            rows = self.export(Tasks.objects.order_by('-created_at'), fields=['task_name'])
+        self.assertEqual([row['task_name'] for row in rows], [4, 3, 2, 1, 0])
+        # 每块查询一次排序字段及主键、一次数据，不使用 OFFSET
+        self.assertEqual(len(queries), 6)
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries))
+
+    def test_prefetch_per_chunk(self):
+        with self.assertNumQueries(9):
+            rows = self.export(Tasks.objects.all(), group='list')
+        self.assertEqual([row['task_name'] for row in rows], [0, 1, 2, 3, 4])
+        self.assertEqual([len(row['report']) for row in rows], [2] * 5)
+
+    def test_iterator_fallback(self):
+        # 关联字段排序无法使用 keyset 分块，退化为 .iterator()
+        TasksTopo.objects.filter(pk=2).update(path='/0')
+        rows = self.export(Tasks.objects.order_by('task_topo__path', 'id'), group='list')
+        self.assertEqual([row['task_name'] for row in rows], [1, 0, 2, 3, 4])
+        self.assertEqual([len(row['report']) for row in rows], [2] * 5)
+
+    def test_stream(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.get_json(api.stream(Tasks.objects.order_by('-id'), chunk_size=2, fields=['task_name']))
+        self.assertEqual([row['task_name'] for row in data['data']], [4, 3, 2, 1, 0])
+        self.assertEqual(len(queries), 6)
+
+
+class WorkerConnectionTests(ApiTestCase):
+    """
+    线程池中执行的函数前后都要关闭过期的数据库连接
+    """
+
+    def record(self, target):
+        from unittest import mock
+
+        events = []
+        patcher = mock.patch(target, lambda: events.append('close'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return events
+
+    def test_async_view(self):
+        from unittest import mock
+        from asgiref.sync import async_to_sync
+
+        events = self.record('model_serializer.response.api.close_old_connections')
+        with mock.patch('model_serializer.response.api.ok', lambda *args, **kwargs: events.append('call')):
+            async_to_sync(api.aok)([1])
+        self.assertEqual(events, ['close', 'call', 'close'])
+
+    def test_concurrent_count(self):
+        from model_serializer.response import count
+
+        events = self.record('model_serializer.response.count.close_old_connections')
+        paginator = type('Paginator', (), dict(count=property(lambda self: events.append('call'))))()
+        count._count_in_thread(paginator)
+        self.assertEqual(events, ['close', 'call', 'close'])
+
+    def test_io_bound_field(self):
+        from model_serializer.serializers import parallel
+
+        events = self.record('model_serializer.serializers.parallel.close_old_connections')
+        parallel._call_in_thread(lambda instance: events.append('call'), None)
+        self.assertEqual(events, ['close', 'call', 'close'])
+
+
+class ExecutorTests(ApiTestCase):
+    """
+    同时到达的第一批请求只创建一个线程池
+    """
+
+    def assert_created_once(self, module, name, get_executor):
+        import time
+        import threading
+        from unittest import mock
+        from concurrent.futures import ThreadPoolExecutor
+
+        created = []
+
+        def create(*args, **kwargs):
+            time.sleep(0.05)
+            created.append(ThreadPoolExecutor(max_workers=1))
+            return created[-1]
+
+        executors = []
+        with mock.patch.object(module, name, None), mock.patch.object(module, 'ThreadPoolExecutor', create):
+            threads = [threading.Thread(target=lambda: executors.append(get_executor())) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        for executor in created:
+            executor.shutdown()
+        self.assertEqual(len(created), 1)
+        self.assertEqual(len(set(map(id, executors))), 1)
+
+    def test_io_executor(self):
+        from model_serializer.serializers import parallel
+
+        self.assert_created_once(parallel, '_io_executor', parallel._get_io_executor)
+
+    def test_count_executor(self):
+        from model_serializer.response import count
+
+        self.assert_created_once(count, '_count_executor', count._get_count_executor)
+
+class CoalesceTests(ApiTestMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.create_data()
+
+        import time
+        from unittest import mock
+        from model_serializer.response.coalesce import single_flight
+        from model_serializer.response.pagination import get_pagination
+
+        self.calls = 0
+        self.error = None
+
+        def slow_pagination(*args, **kwargs):
+            self.calls += 1
+            time.sleep(0.2)
+            if self.error is not None:
+                raise self.error
+            return get_pagination(*args, **kwargs)
+
+        patcher = mock.patch('model_serializer.response.api.get_pagination', slow_pagination)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(single_flight.clear)
+
+    def page(self, query='/', coalesce=True):
+        return api.page(self.rf.get(query), Tasks.objects.order_by('id'), group='list', coalesce=coalesce)
+
+    def test_concurrent_requests(self):
+        import threading
+
+        responses = []
+        threads = [threading.Thread(target=lambda: responses.append(self.page())) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len({response.content for response in responses}), 1)
+        self.assertEqual(len(self.get_json(responses[0])['data']), 5)
+        # 已完成的请求不再共享
+        self.page()
+        self.assertEqual(self.calls, 2)
+
+    def test_ttl(self):
+        first = self.page(coalesce=5)
+        second = self.page(coalesce=5)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(second['Content-Type'], 'application/json')
+
+        self.page('/?page_size=2', coalesce=5)
+        self.assertEqual(self.calls, 2)
+
+    def test_errors_not_cached(self):
+        self.error = ValueError('pagination')
+        with self.assertRaisesMessage(ValueError, 'pagination'):
+            self.page(coalesce=5)
+        self.error = None
+        self.assertEqual(len(self.get_json(self.page(coalesce=5))['data']), 5)
+        self.assertEqual(self.calls, 2)
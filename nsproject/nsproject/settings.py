@@ -124,4 +124,7 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# 启动时预先编译所有 Model 的 Serializer
+MODEL_SERIALIZER_EAGER_COMPILE = True
+
 